@@ -0,0 +1,68 @@
+from django.urls import path
+from crm.api import ApiDetailView, ApiListView, Field, Related
+from .cache import COMPANIES, INTERACTIONS, PROJECTS
+from .models import Company, Project
+
+
+class CompanyResource:
+    """Fields of a company in API responses"""
+    model = Company
+    ordering = 'pk'
+    cache_namespaces = (COMPANIES, INTERACTIONS)
+    last_modified_field = 'date_edit'
+    fields = {
+        'id': Field('id'),
+        'name': Field('name'),
+        'address': Field('address'),
+        'description': Field('description'),
+        'date_create': Field('date_create'),
+        'date_edit': Field('date_edit'),
+        'phones': Related('phone_set', 'phone'),
+        'emails': Related('companyemail_set', 'company_email'),
+        'contacts': Related('companymanager_set', 'name', 'surname', 'manager_position'),
+        'interaction_count': Field('stats.interaction_count'),
+        'grade': Field('stats.grade', columns=['stats__grade_sum', 'stats__interaction_count']),
+    }
+
+
+class ProjectResource:
+    """Fields of a project in API responses"""
+    model = Project
+    ordering = 'pk'
+    cache_namespaces = (PROJECTS, INTERACTIONS)
+    fields = {
+        'id': Field('id'),
+        'project': Field('project'),
+        'company': Field('company_id'),
+        'company_name': Field('company.name'),
+        'description': Field('description'),
+        'start_date': Field('start_date'),
+        'final_date': Field('final_date'),
+        'price': Field('price'),
+        'interaction_count': Field('stats.interaction_count'),
+        'grade': Field('stats.grade', columns=['stats__grade_sum', 'stats__interaction_count']),
+    }
+
+
+class CompanyApiList(CompanyResource, ApiListView):
+    """Companies for authenticated users"""
+
+
+class CompanyApiDetail(CompanyResource, ApiDetailView):
+    """Company for authenticated users"""
+
+
+class ProjectApiList(ProjectResource, ApiListView):
+    """Projects for authenticated users"""
+
+
+class ProjectApiDetail(ProjectResource, ApiDetailView):
+    """Project for authenticated users"""
+
+
+urlpatterns = [
+    path('companies/', CompanyApiList.as_view(), name='api_company_list'),
+    path('companies/<int:pk>/', CompanyApiDetail.as_view(), name='api_company_detail'),
+    path('projects/', ProjectApiList.as_view(), name='api_project_list'),
+    path('projects/<int:pk>/', ProjectApiDetail.as_view(), name='api_project_detail'),
+]
@@ -0,0 +1,96 @@
+"""
+Versioned cache invalidation.
+
+Cached pages, fragments, API ETags and other cached data put the versions of
+the namespaces they read into their keys, a write bumps the versions instead
+of deleting keys. Versions live in the cache itself, so every process has to
+share one cache backend (redis, memcached, database): with the per-process
+locmem cache a bump reaches only the worker that made the write.
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+COMPANIES = 'companies'
+PROJECTS = 'projects'
+INTERACTIONS = 'interactions'
+KEYWORDS = 'keywords'
+USERS = 'users'
+PERMISSIONS = 'permissions'
+
+
+def version_key(namespace):
+    return f'cache_version:{namespace}'
+
+
+def get_versions(*namespaces):
+    """Get current versions of namespaces, missing versions start from current time"""
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump_versions(*namespaces):
+    """Make all cached pages and fragments of namespaces stale"""
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            cache.set(version_key(namespace), time.time_ns(), None)
+
+
+def is_fragment_cached(fragment_name, *vary_on):
+    return cache.get(make_template_fragment_key(fragment_name, vary_on)) is not None
+
+
+class FragmentCacheMixin:
+    """Add namespace version and timeout for {% cache %} blocks of a template"""
+    cache_namespaces = ()
+
+    def get_cache_version(self):
+        if not hasattr(self, 'cache_version'):
+            self.cache_version = get_versions(*self.cache_namespaces)
+        return self.cache_version
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cache_version'] = self.get_cache_version()
+        context['cache_timeout'] = settings.FRAGMENT_CACHE_TIMEOUT
+        return context
+
+
+class CachedListMixin:
+    """Serve rendered ListView pages from cache per user, page and namespace version"""
+    cache_namespaces = ()
+
+    def get_page_cache_key(self):
+        request = self.request
+        user = request.user
+        # the header shows the username and links depend on staff status and permissions
+        namespaces = dict.fromkeys((*self.cache_namespaces, USERS, PERMISSIONS))
+        raw = f'{request.get_full_path()}:{user.pk}:{get_versions(*namespaces)}'
+        return f'page:{type(self).__name__}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_page_cache_key()
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content)
+        else:
+            response = super().get(request, *args, **kwargs)
+
+            def store(rendered):
+                if rendered.status_code == 200:
+                    cache.set(key, rendered.content, settings.PAGE_CACHE_TIMEOUT)
+
+            response.add_post_render_callback(store)
+        patch_vary_headers(response, ['Cookie'])
+        return response
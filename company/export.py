@@ -0,0 +1,122 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.views.generic import View
+from django.views.generic.list import MultipleObjectMixin
+from .pagination import CursorPaginationMixin
+
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+# Spreadsheets read cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object returning written value so csv.writer can produce lines for streaming"""
+
+    def write(self, value):
+        return value
+
+
+def iterate_keyset(queryset, chunk_size):
+    """Iterate a queryset with one query per chunk, each starting after the last row of the previous one
+
+    Orderings on annotations cannot be resumed, they are read at once.
+    """
+    ordering = CursorPaginationMixin.get_cursor_ordering(queryset)
+    if ordering is None:
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+    fields = [CursorPaginationMixin.get_cursor_field(queryset.model, field).attname for field in ordering]
+    queryset, values = queryset.order_by(*ordering), None
+    while True:
+        chunk = queryset if values is None else queryset.filter(
+            CursorPaginationMixin.keyset_filter(ordering, values, False))
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        values = [getattr(rows[-1], field) for field in fields]
+
+
+def iterate(queryset, chunk_size, prefetch=()):
+    """Iterate a queryset with a server-side cursor, prefetching relations chunk by chunk
+
+    Without server-side cursors (DISABLE_SERVER_SIDE_CURSORS behind pgbouncer)
+    the driver would fetch the whole result, so rows are read by keyset.
+    """
+    if connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        objects = iterate_keyset(queryset, chunk_size)
+    else:
+        objects = queryset.iterator(chunk_size=chunk_size)
+    chunk = []
+    for obj in objects:
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            prefetch_related_objects(chunk, *prefetch)
+            yield from chunk
+            chunk = []
+    prefetch_related_objects(chunk, *prefetch)
+    yield from chunk
+
+
+class StreamingExportMixin(MultipleObjectMixin):
+    """Stream queryset rows as CSV or JSON Lines without loading them into memory
+
+    export_fields maps a column name to an attribute path or to a callable
+    taking the object, export_prefetch relations are loaded per chunk.
+    """
+    export_fields = {}
+    export_prefetch = ()
+    export_name = 'export'
+    chunk_size = 2000
+
+    def get_export_format(self):
+        export_format = self.request.GET.get('format', 'csv')
+        if export_format not in CONTENT_TYPES:
+            raise Http404(f'Неизвестный формат "{export_format}"')
+        return export_format
+
+    def get_export_value(self, obj, field):
+        if callable(field):
+            return field(obj)
+        for attr in field.split('.'):
+            obj = getattr(obj, attr) if obj is not None else None
+        return obj
+
+    def get_rows(self):
+        for obj in iterate(self.get_queryset(), self.chunk_size, self.export_prefetch):
+            yield [self.get_export_value(obj, field) for field in self.export_fields.values()]
+
+    @staticmethod
+    def escape_formula(value):
+        """Keep spreadsheets from running text cells as formulas"""
+        if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+            return "'" + value
+        return value
+
+    def stream_csv(self):
+        writer = csv.writer(Echo())
+        yield '\ufeff' + writer.writerow(list(self.export_fields))
+        for row in self.get_rows():
+            yield writer.writerow([self.escape_formula(value) for value in row])
+
+    def stream_jsonl(self):
+        names = list(self.export_fields)
+        for row in self.get_rows():
+            yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+    def get(self, request, *args, **kwargs):
+        export_format = self.get_export_format()
+        response = StreamingHttpResponse(getattr(self, f'stream_{export_format}')(),
+                                         content_type=CONTENT_TYPES[export_format])
+        filename = f'{self.export_name}-{timezone.localdate():%Y%m%d}.{export_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class StreamingExportView(StreamingExportMixin, View):
+    """Export view over model or queryset"""
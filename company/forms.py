@@ -11,4 +11,16 @@ class CompanyForm(forms.ModelForm):
 
 ManagerFormSet = inlineformset_factory(Company, CompanyManager, fields='__all__', can_delete=True)
 PhoneFormset = inlineformset_factory(Company, Phone, fields='__all__', extra=3, can_delete=True)
-EmailFormSet = inlineformset_factory(Company, CompanyEmail, fields='__all__', extra=3, can_delete=True)
\ No newline at end of file
+EmailFormSet = inlineformset_factory(Company, CompanyEmail, fields='__all__', extra=3, can_delete=True)
+
+
+class ImportForm(forms.Form):
+    """Form for importing companies or projects from a CSV or XLSX file"""
+    kind = forms.ChoiceField(label='Данные', choices=[('companies', 'Компании с контактами'), ('projects', 'Проекты')])
+    file = forms.FileField(label='Файл CSV или XLSX')
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if not file.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Поддерживаются только файлы CSV и XLSX')
+        return file
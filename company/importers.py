@@ -0,0 +1,177 @@
+import csv
+import io
+import os
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .cache import COMPANIES, PROJECTS, bump_versions
+from .models import Company, CompanyEmail, CompanyManager, Phone, Project
+from .services import bulk_create_with_pks
+
+LIST_SEPARATOR = ';'
+POSITION_SEPARATOR = ' - '
+
+
+def read_rows(file, filename):
+    """Yield row dicts from a CSV or XLSX file one by one without loading the whole file"""
+    if os.path.splitext(filename)[1].lower() == '.xlsx':
+        yield from read_xlsx(file)
+    else:
+        yield from read_csv(file)
+
+
+def read_csv(file):
+    text = file if isinstance(file, io.TextIOBase) else io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    yield from csv.DictReader(text)
+
+
+def read_xlsx(file):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValidationError('Для импорта XLSX установите openpyxl')
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for values in rows:
+            yield {name: '' if value is None else value for name, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def split_list(value):
+    return [item.strip() for item in str(value or '').split(LIST_SEPARATOR) if item.strip()]
+
+
+def errors_text(error):
+    if not hasattr(error, 'error_dict'):
+        return ', '.join(error.messages)
+    return '; '.join(', '.join(messages) if field == '__all__' else f'{field}: {", ".join(messages)}'
+                     for field, messages in error.message_dict.items())
+
+
+class ImportReport:
+    """Counters of created rows and errors by line number"""
+
+    def __init__(self):
+        self.created = {}
+        self.rows = 0
+        self.errors = []
+
+    def add_created(self, name, count):
+        self.created[name] = self.created.get(name, 0) + count
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+
+class BaseImporter:
+    """Validate rows one by one and write valid ones in chunked bulk inserts"""
+    first_line = 2
+
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.report = ImportReport()
+
+    def run(self, rows):
+        chunk = []
+        for line, row in enumerate(rows, start=self.first_line):
+            self.report.rows += 1
+            try:
+                chunk.append((line, self.build(row)))
+            except ValidationError as error:
+                self.report.add_error(line, errors_text(error))
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+        if chunk:
+            self.flush(chunk)
+        return self.report
+
+    def build(self, row):
+        """Get validated unsaved objects of one row or raise ValidationError"""
+        raise NotImplementedError
+
+    def flush(self, chunk):
+        with transaction.atomic():
+            self.save(chunk)
+            transaction.on_commit(lambda: bump_versions(COMPANIES, PROJECTS))
+
+    def save(self, chunk):
+        """Write (line, objects) pairs of one chunk"""
+        raise NotImplementedError
+
+
+class CompanyImporter(BaseImporter):
+    """Import companies with phones, emails and contact persons
+
+    Columns: name, address, description, phones, emails, contacts. Lists are
+    separated by ";", a contact is written as "Name Surname - Position".
+    """
+
+    def build(self, row):
+        company = Company(name=str(row.get('name', '')).strip(), address=str(row.get('address', '')).strip(),
+                          description=str(row.get('description', '')).strip() or None)
+        company.full_clean()
+        phones = [Phone(phone=phone) for phone in split_list(row.get('phones'))]
+        emails = [CompanyEmail(company_email=email) for email in split_list(row.get('emails'))]
+        contacts = [self.build_contact(contact) for contact in split_list(row.get('contacts'))]
+        for obj in phones + emails + contacts:
+            obj.full_clean(exclude=['company'])
+        return company, phones, emails, contacts
+
+    @staticmethod
+    def build_contact(value):
+        person, _, position = value.partition(POSITION_SEPARATOR)
+        name, _, surname = person.strip().partition(' ')
+        return CompanyManager(name=name, surname=surname.strip(), manager_position=position.strip())
+
+    def save(self, chunk):
+        companies = bulk_create_with_pks(Company, [objs[0] for _, objs in chunk], self.chunk_size)
+        children = {Phone: [], CompanyEmail: [], CompanyManager: []}
+        for company, (_, (_, phones, emails, contacts)) in zip(companies, chunk):
+            for obj in phones + emails + contacts:
+                obj.company = company
+                children[type(obj)].append(obj)
+        self.report.add_created('companies', len(companies))
+        for model, objs in children.items():
+            model.objects.bulk_create(objs, batch_size=self.chunk_size)
+            self.report.add_created(model._meta.model_name, len(objs))
+
+
+class ProjectImporter(BaseImporter):
+    """Import projects of existing companies
+
+    Columns: company (company name), project, description, start_date,
+    final_date, price.
+    """
+
+    def build(self, row):
+        project = Project(project=str(row.get('project', '')).strip(), description=str(row.get('description', '')),
+                          start_date=row.get('start_date') or None, final_date=row.get('final_date') or None,
+                          price=row.get('price') or None)
+        project.full_clean(exclude=['company'])
+        company = str(row.get('company', '')).strip()
+        if not company:
+            raise ValidationError({'company': ['Укажите компанию']})
+        return project, company
+
+    def save(self, chunk):
+        names = {name for _, (_, name) in chunk}
+        companies = {}
+        for pk, name in Company.objects.filter(name__in=names).values_list('pk', 'name'):
+            companies.setdefault(name, []).append(pk)
+        projects = []
+        for line, (project, name) in chunk:
+            if len(companies.get(name, ())) != 1:
+                reason = 'не найдена' if name not in companies else 'не уникальна'
+                self.report.add_error(line, f'company: Компания "{name}" {reason}')
+                continue
+            project.company_id = companies[name][0]
+            projects.append(project)
+        Project.objects.bulk_create(projects, batch_size=self.chunk_size)
+        self.report.add_created('projects', len(projects))
+        self.report.errors.sort(key=lambda error: error[0])
+
+
+IMPORTERS = {'companies': CompanyImporter, 'projects': ProjectImporter}
@@ -0,0 +1,35 @@
+import csv
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from company.importers import IMPORTERS, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import companies with contacts or projects from a CSV or XLSX file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file')
+        parser.add_argument('--kind', choices=sorted(IMPORTERS), default='companies', help='What the file contains')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows written per transaction')
+        parser.add_argument('--errors', help='Path of CSV report with rejected rows')
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options['kind']](chunk_size=options['chunk_size'])
+        try:
+            with open(options['path'], 'rb') as file:
+                report = importer.run(read_rows(file, options['path']))
+        except (OSError, ValidationError) as error:
+            raise CommandError(error)
+        created = ', '.join(f'{name}: {count}' for name, count in report.created.items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(f'Rows read: {report.rows}, created {created}'))
+        if not report.errors:
+            return
+        self.stdout.write(self.style.WARNING(f'Rejected rows: {len(report.errors)}'))
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['line', 'error'])
+                writer.writerows(report.errors)
+        else:
+            for line, message in report.errors:
+                self.stdout.write(f'{line}: {message}')
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0005_alter_company_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['name', 'id'], name='company_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['date_create', 'id'], name='company_date_create_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:52
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0006_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='phone',
+            name='phone',
+            field=models.CharField(help_text='Введите номер телефона в формате "0XXXXXXXXX"', max_length=10, null=True, validators=[django.core.validators.RegexValidator('^\\d{10}$', 'Номер телефона должен состоять из 10 цифр')], verbose_name='Телефон'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.core.validators import RegexValidator
 from django.db import models
 from django.urls import reverse
 from ckeditor.fields import RichTextField
@@ -33,7 +34,8 @@ class CompanyEmail(models.Model):
 class Phone(models.Model):
     """Model representing a phone for company"""
     company = models.ForeignKey('Company', verbose_name='Компания', on_delete=models.CASCADE, null=True)
-    phone = models.CharField(max_length=10, verbose_name='Телефон', null=True, blank=False, help_text='Введите номер телефона в формате "0XXXXXXXXX"')
+    phone = models.CharField(max_length=10, verbose_name='Телефон', null=True, blank=False, help_text='Введите номер телефона в формате "0XXXXXXXXX"',
+                             validators=[RegexValidator(r'^\d{10}$', 'Номер телефона должен состоять из 10 цифр')])
 
     def __str__(self):
         return f'+38{self.phone}'
@@ -57,6 +59,10 @@ class Company(models.Model):
     class Meta:
         verbose_name = 'Компания'
         verbose_name_plural = 'Компании'
+        indexes = [
+            models.Index(fields=['name', 'id'], name='company_name_id_idx'),
+            models.Index(fields=['date_create', 'id'], name='company_date_create_id_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('company_detail', kwargs={'pk': self.id})
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+class CursorPage:
+    """Page of a keyset paginated list with opaque tokens of neighbouring pages"""
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginationMixin:
+    """Keyset pagination for ListView without COUNT and OFFSET
+
+    Turned on for every request by CURSOR_PAGINATION setting or for a single
+    request by the cursor parameter. Orderings on annotations fall back to
+    the default offset paginator.
+    """
+    cursor_param = 'cursor'
+    cursor_salt = 'crm.cursor'
+
+    def use_cursor_pagination(self):
+        return getattr(settings, 'CURSOR_PAGINATION', False) or self.cursor_param in self.request.GET
+
+    @classmethod
+    def get_cursor_ordering(cls, queryset):
+        """Get ordering of queryset with pk as tie-breaker or None if it is not keyset compatible"""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        for field in ordering:
+            if not isinstance(field, str) or not cls.get_cursor_field(queryset.model, field):
+                return None
+        if not {'pk', '-pk', 'id', '-id'}.intersection(ordering):
+            ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+        return ordering
+
+    @staticmethod
+    def get_cursor_field(model, field):
+        name = field.lstrip('-')
+        if name == 'pk':
+            return model._meta.pk
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        return model_field if model_field.concrete and not model_field.is_relation else None
+
+    def encode_cursor(self, obj, ordering, backward):
+        values = [self.get_cursor_field(type(obj), field).value_to_string(obj) for field in ordering]
+        return signing.dumps({'v': values, 'b': backward}, salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, model, ordering):
+        token = self.request.GET.get(self.cursor_param)
+        if not token:
+            return None, False
+        try:
+            data = signing.loads(token, salt=self.cursor_salt)
+            if len(data['v']) != len(ordering):
+                raise ValueError('Cursor does not match ordering')
+            values = [self.get_cursor_field(model, field).to_python(value) for field, value in zip(ordering, data['v'])]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            raise Http404('Invalid cursor')
+        return values, bool(data['b'])
+
+    @staticmethod
+    def keyset_filter(ordering, values, backward):
+        """Get condition selecting rows after (or before) the cursor row in ordering"""
+        condition, equal = Q(), {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'gt' if field.startswith('-') == backward else 'lt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_cursor_ordering(queryset)
+        if not self.use_cursor_pagination() or ordering is None:
+            return super().paginate_queryset(queryset, page_size)
+        values, backward = self.decode_cursor(queryset.model, ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values, backward))
+        if backward:
+            reverse = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+            rows = list(queryset.order_by(*reverse)[:page_size + 1])
+            has_more, rows = len(rows) > page_size, rows[:page_size][::-1]
+            has_next, has_previous = True, has_more
+        else:
+            rows = list(queryset.order_by(*ordering)[:page_size + 1])
+            has_more, rows = len(rows) > page_size, rows[:page_size]
+            has_next, has_previous = has_more, values is not None
+        page = CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], ordering, False) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], ordering, True) if rows and has_previous else None,
+        )
+        return None, page, page.object_list, page.has_other_pages()
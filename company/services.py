@@ -0,0 +1,51 @@
+from django.db import connection, transaction
+from .cache import COMPANIES, PROJECTS, bump_versions
+
+
+def bulk_create_with_pks(model, objs, batch_size=1000):
+    """Insert rows in batches and return them with primary keys
+
+    Backends that cannot return ids from bulk insert get the rows back by the
+    newest primary keys, so call it inside a transaction.
+    """
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    if connection.features.can_return_rows_from_bulk_insert or not objs:
+        return objs
+    return list(model.objects.order_by('-pk')[:len(objs)])[::-1]
+
+
+def save_inline_formset(formset, parent):
+    """Write a validated inline formset with one bulk insert, one bulk update and one delete"""
+    fk_name = formset.fk.name
+    deleted = set(formset.deleted_forms) if formset.can_delete else set()
+    new_objects, changed_objects, deleted_pks, fields = [], [], [], set()
+    for form in formset.initial_forms:
+        if form in deleted:
+            if form.instance.pk is not None:
+                deleted_pks.append(form.instance.pk)
+        elif form.has_changed():
+            changed_objects.append(form.save(commit=False))
+            fields.update(name for name in form.changed_data if name not in (fk_name, 'id', 'DELETE'))
+    for form in formset.extra_forms:
+        if form.has_changed() and form not in deleted:
+            obj = form.save(commit=False)
+            setattr(obj, fk_name, parent)
+            new_objects.append(obj)
+    model = formset.model
+    if deleted_pks:
+        model.objects.filter(pk__in=deleted_pks).delete()
+    if changed_objects and fields:
+        model.objects.bulk_update(changed_objects, sorted(fields))
+    if new_objects:
+        model.objects.bulk_create(new_objects)
+
+
+@transaction.atomic
+def save_company_with_contacts(form, formsets):
+    """Save company form and its contact formsets in one transaction, formsets must be validated"""
+    company = form.save()
+    for formset in formsets:
+        formset.instance = company
+        save_inline_formset(formset, company)
+    transaction.on_commit(lambda: bump_versions(COMPANIES, PROJECTS))
+    return company
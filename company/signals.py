@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import COMPANIES, PROJECTS, bump_versions
+from .models import Company, CompanyEmail, CompanyManager, Phone, Project
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_company_and_project_pages(sender, **kwargs):
+    """Company names are shown on project pages and projects on company pages"""
+    bump_versions(COMPANIES, PROJECTS)
+
+
+@receiver(post_save, sender=Phone)
+@receiver(post_delete, sender=Phone)
+@receiver(post_save, sender=CompanyEmail)
+@receiver(post_delete, sender=CompanyEmail)
+@receiver(post_save, sender=CompanyManager)
+@receiver(post_delete, sender=CompanyManager)
+def invalidate_company_pages(sender, **kwargs):
+    """Contacts are shown on company pages only"""
+    bump_versions(COMPANIES)
@@ -0,0 +1,33 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.safestring import mark_safe
+from crm import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def stylesheet(bundle):
+    """Link the built bundle or, in development, its sources"""
+    if settings.ASSET_BUNDLES:
+        return mark_safe(f'<link rel="stylesheet" href="{static(bundle)}">')
+    return mark_safe('\n'.join(assets.source_tags(bundle)))
+
+
+@register.simple_tag
+def script(bundle):
+    """Load the built bundle or, in development, its sources"""
+    if settings.ASSET_BUNDLES:
+        return mark_safe(f'<script src="{static(bundle)}"></script>')
+    return mark_safe('\n'.join(assets.source_tags(bundle)))
+
+
+@register.simple_tag
+def preload(*bundles):
+    """Preload hints for the icon font, found only after CSS is parsed, and bundled scripts"""
+    if not settings.ASSET_BUNDLES:
+        return ''
+    hints = [f'<link rel="preload" href="{static(assets.ICONS_FONT)}" as="font" type="font/woff2" crossorigin>']
+    hints.extend(f'<link rel="preload" href="{static(bundle)}" as="script">' for bundle in bundles)
+    return mark_safe('\n'.join(hints))
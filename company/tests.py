@@ -1,3 +1,419 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+from fontTools.ttLib import TTFont
+from openpyxl import Workbook
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Count
+from django.http import Http404, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.views.generic import ListView
+from .models import Company, CompanyEmail, CompanyManager, Phone, Project
+from .views import CompanyExportView, CompanyListView, InteractionAggregateMixin
+from crm import assets
+from crm.permissions import CachedModelBackend
+from management.models import Interaction, Keyword, User
 
-# Create your tests here.
+
+@override_settings(SECURE_SSL_REDIRECT=False, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class QueryBudgetTestCase(TestCase):
+    """Base test case with CRM fixtures and a maximum query count assertion"""
+    rows = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('manager', 'manager@example.com', 'password')
+        today = datetime.date.today()
+        for number in range(cls.rows):
+            company = Company.objects.create(name=f'Company {number}', address='Kyiv', description='<p>text</p>')
+            Phone.objects.bulk_create([Phone(company=company, phone=f'050000000{i}') for i in range(cls.rows)])
+            CompanyEmail.objects.bulk_create([CompanyEmail(company=company, company_email=f'{i}@example.com')
+                                              for i in range(cls.rows)])
+            CompanyManager.objects.bulk_create([CompanyManager(company=company, name='Ivan', surname='Ivanov',
+                                                               manager_position='CEO') for _ in range(cls.rows)])
+            for i in range(cls.rows):
+                project = Project.objects.create(project=f'Project {i}', company=company, description='text',
+                                                 start_date=today, final_date=today, price=100)
+                Interaction.objects.create(project=project, company=company, channel='Email', manager=cls.user,
+                                           description=f'call about contract {i}', grade=i % 5 + 1)
+        Keyword.objects.create(keyword='contract')
+        cls.company = Company.objects.first()
+        cls.project = Project.objects.first()
+        cls.interaction = Interaction.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        # Requests compared with each other should all find the user of the session cached
+        CachedModelBackend().get_user(self.user.pk)
+
+    def assertMaxQueries(self, num, url, status_code=200):
+        """Request url and fail if the view runs more than num queries"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            if response.streaming:
+                response.streamed = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, status_code)
+        executed = len(context.captured_queries)
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(executed, num, f'{url} executed {executed} queries, budget is {num}:\n{queries}')
+        return response
+
+
+class CompanyQueryCountTest(QueryBudgetTestCase):
+    """Query budgets of company and project views"""
+
+    def test_company_list(self):
+        self.assertMaxQueries(4, reverse('company_list'))
+
+    def test_company_detail(self):
+        response = self.assertMaxQueries(7, reverse('company_detail', kwargs={'pk': self.company.pk}))
+        self.assertContains(response, 'Project 4')
+
+    def test_company_create(self):
+        self.assertMaxQueries(3, reverse('company_create'))
+
+    def test_company_update(self):
+        self.assertMaxQueries(6, reverse('company_update', kwargs={'pk': self.company.pk}))
+
+    def test_company_delete(self):
+        self.assertMaxQueries(3, reverse('company_delete', kwargs={'pk': self.company.pk}))
+
+    def test_project_list(self):
+        self.assertMaxQueries(4, reverse('project_list'))
+
+    def test_project_detail(self):
+        self.assertMaxQueries(4, reverse('project_detail', kwargs={'pk': self.project.pk}))
+
+    def test_project_create(self):
+        self.assertMaxQueries(3, reverse('project_create'))
+
+    def test_project_update(self):
+        self.assertMaxQueries(4, reverse('project_update', kwargs={'pk': self.project.pk}))
+
+    def test_project_delete(self):
+        self.assertMaxQueries(3, reverse('project_delete', kwargs={'pk': self.project.pk}))
+
+    def test_interaction_by_company(self):
+        Interaction.objects.create(project=self.project, company=self.company, channel='Звонок',
+                                   manager=self.user, description='call', grade=5)
+        response = self.assertMaxQueries(5, reverse('interaction_by_company', kwargs={'pk': self.company.pk}))
+        self.assertEqual(response.context['grade'], 20 / 6)
+        self.assertEqual(response.context['channel_counts'],
+                         [{'channel': 'Звонок', 'count': 1}, {'channel': 'Email', 'count': self.rows}])
+        self.assertEqual(response.context['paginator'].count, self.rows + 1)
+
+    def test_cached_company_list_is_invalidated(self):
+        self.assertMaxQueries(4, reverse('company_list'))
+        self.assertMaxQueries(0, reverse('company_list'))
+        Company.objects.filter(pk=self.company.pk).get().save(update_fields=['name'])
+        self.assertMaxQueries(4, reverse('company_list'))
+
+    def test_cached_list_follows_user(self):
+        self.assertNotContains(self.client.get(reverse('project_list')), 'renamed-manager')
+        self.user.username = 'renamed-manager'
+        self.user.is_staff = False
+        self.user.save()
+        self.assertContains(self.client.get(reverse('project_list')), 'renamed-manager')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db', USER_CACHE_TIMEOUT=0)
+    def test_cached_company_list_with_database_sessions(self):
+        self.client.force_login(self.user)
+        self.assertMaxQueries(4, reverse('company_list'))
+        self.assertMaxQueries(2, reverse('company_list'))
+
+    def test_cached_company_detail_is_invalidated(self):
+        url = reverse('company_detail', kwargs={'pk': self.company.pk})
+        self.assertMaxQueries(7, url)
+        self.assertMaxQueries(3, url)
+        Phone.objects.create(company=self.company, phone='0671234567')
+        self.assertContains(self.assertMaxQueries(7, url), '0671234567')
+
+    def test_interaction_by_project(self):
+        response = self.assertMaxQueries(5, reverse('interaction_by_project', kwargs={'pk': self.project.pk}))
+        self.assertEqual(response.context['project'], self.project)
+        self.assertEqual(response.context['grade'], self.interaction.grade)
+        self.assertEqual(response.context['channel_counts'], [{'channel': 'Email', 'count': 1}])
+
+    def test_interaction_aggregate_needs_model(self):
+        view = type('View', (InteractionAggregateMixin, ListView), {'owner_field': 'company'})()
+        view.setup(RequestFactory().get('/'), pk=self.company.pk)
+        with self.assertRaises(ImproperlyConfigured):
+            view.get_queryset()
+
+
+class CompanySaveTest(QueryBudgetTestCase):
+    """Company with contacts is written with a constant number of queries"""
+    rows = 1
+
+    @staticmethod
+    def formset_data(prefix, rows, initial=0):
+        data = {f'{prefix}-TOTAL_FORMS': len(rows), f'{prefix}-INITIAL_FORMS': initial,
+                f'{prefix}-MIN_NUM_FORMS': 0, f'{prefix}-MAX_NUM_FORMS': 1000}
+        for number, row in enumerate(rows):
+            data.update({f'{prefix}-{number}-{name}': value for name, value in row.items()})
+        return data
+
+    def post_company(self, url, contacts, **extra):
+        data = {'name': 'Acme', 'address': 'Kyiv', 'description': ''}
+        data.update(self.formset_data('phone_set', [{'phone': f'05000000{i:02d}'} for i in range(contacts)]))
+        data.update(self.formset_data('companyemail_set', [{'company_email': f'{i}@acme.com'} for i in range(contacts)]))
+        data.update(self.formset_data('companymanager_set', [
+            {'name': 'ivan', 'surname': 'petrenko', 'manager_position': 'CEO'} for _ in range(contacts)]))
+        data.update(extra)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        return len(context.captured_queries)
+
+    def test_create_queries_do_not_grow_with_contacts(self):
+        few = self.post_company(reverse('company_create'), 1)
+        many = self.post_company(reverse('company_create'), 20)
+        self.assertEqual(few, many)
+        company = Company.objects.latest('pk')
+        self.assertEqual(company.phone_set.count(), 20)
+        self.assertEqual(company.companymanager_set.first().name, 'Ivan')
+
+    def test_update_replaces_contacts(self):
+        phone = Phone.objects.create(company=self.company, phone='0500000009')
+        removed = Phone.objects.create(company=self.company, phone='0500000008')
+        Phone.objects.filter(company=self.company).exclude(pk__in=[phone.pk, removed.pk]).delete()
+        url = reverse('company_update', kwargs={'pk': self.company.pk})
+        extra = self.formset_data('phone_set', [{'id': phone.pk, 'phone': '0671111111'},
+                                                {'id': removed.pk, 'phone': removed.phone, 'DELETE': 'on'},
+                                                {'phone': '0672222222'}], initial=2)
+        self.post_company(url, 0, **extra)
+        self.assertEqual(sorted(self.company.phone_set.values_list('phone', flat=True)), ['0671111111', '0672222222'])
+
+
+class CompanyImportTest(QueryBudgetTestCase):
+    """Bulk import of companies and projects from CSV"""
+    rows = 1
+    companies = ('name,address,description,phones,emails,contacts\n'
+                 'Import 1,Kyiv,,0501112233;0671112233,a@example.com,ivan petrov - CEO\n'
+                 'Import 2,Lviv,,12345,b@example.com,\n'
+                 ',Odesa,,,,\n'
+                 'Import 3,Dnipro,,,,olena - Manager\n')
+
+    def upload(self, kind, content):
+        return self.client.post(reverse('company_import'), {
+            'kind': kind, 'file': SimpleUploadedFile('data.csv', content.encode()),
+        })
+
+    def test_import_companies(self):
+        response = self.upload('companies', self.companies)
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report']
+        self.assertEqual(report.rows, 4)
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5])
+        self.assertEqual(report.created['companies'], 1)
+        company = Company.objects.get(name='Import 1')
+        self.assertEqual(company.phone_set.count(), 2)
+        self.assertEqual(str(company.companymanager_set.get()), 'Ivan Petrov')
+
+    def test_import_xlsx(self):
+        workbook = Workbook()
+        for row in csv.reader(io.StringIO(self.companies)):
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        response = self.client.post(reverse('company_import'), {
+            'kind': 'companies', 'file': SimpleUploadedFile('data.xlsx', content.getvalue()),
+        })
+        self.assertEqual(response.context['report'].created['companies'], 1)
+        self.assertEqual(Company.objects.get(name='Import 1').phone_set.count(), 2)
+
+    def test_import_companies_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            self.upload('companies', self.companies)
+        many = self.companies + ''.join(f'Bulk {i},Kyiv,,0500000000,{i}@example.com,ivan petrov - CEO\n'
+                                        for i in range(20))
+        with CaptureQueriesContext(connection) as large:
+            self.upload('companies', many)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_import_projects(self):
+        Company.objects.create(name='Twin', address='Kyiv')
+        Company.objects.create(name='Twin', address='Lviv')
+        response = self.upload('projects', 'company,project,description,start_date,final_date,price\n'
+                                           'Company 0,New,text,2024-01-01,2024-02-01,100\n'
+                                           'Twin,Other,text,2024-01-01,2024-02-01,100\n'
+                                           'Company 0,Broken,text,soon,2024-02-01,-5\n')
+        report = response.context['report']
+        self.assertEqual(report.created['projects'], 1)
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+        self.assertTrue(Project.objects.filter(project='New', company=self.company).exists())
+
+
+class ExportTest(QueryBudgetTestCase):
+    """Streaming export of companies and projects"""
+
+    def test_company_export_csv(self):
+        response = self.assertMaxQueries(6, reverse('company_export'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = response.streamed.lstrip('\ufeff').splitlines()
+        self.assertEqual(lines[0], 'id,name,address,description,date_create,date_edit,phones,emails,contacts')
+        self.assertEqual(len(lines), self.rows + 1)
+        self.assertIn('0500000000; 0500000001', lines[1])
+
+    def test_csv_formulas_escaped(self):
+        Company.objects.filter(pk=self.company.pk).update(name='=HYPERLINK("http://example.com")',
+                                                           address='@SUM(1)')
+        Phone.objects.filter(company=self.company).update(phone='+380500000000')
+        response = self.client.get(reverse('company_export'))
+        rows = csv.reader(io.StringIO(b''.join(response.streaming_content).decode().lstrip('\ufeff')))
+        row = next(row for row in rows if row[0] == str(self.company.pk))
+        self.assertEqual(row[1:3], ['\'=HYPERLINK("http://example.com")', "'@SUM(1)"])
+        self.assertTrue(row[6].startswith("'+380"))
+        jsonl = b''.join(self.client.get(reverse('company_export') + '?format=jsonl').streaming_content)
+        self.assertEqual(json.loads(jsonl.splitlines()[0])['name'], '=HYPERLINK("http://example.com")')
+
+    def test_company_export_prefetches_per_chunk(self):
+        with mock.patch.object(CompanyExportView, 'chunk_size', 2), CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('company_export') + '?format=jsonl')
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), self.rows)
+        self.assertLessEqual(len(context.captured_queries), 3 + 3 * 3)
+
+    def test_export_by_keyset_without_server_side_cursors(self):
+        url = reverse('interaction_export') + '?format=jsonl'
+        ids = [json.loads(line)['id'] for line in self.assertMaxQueries(4, url).streamed.splitlines()]
+        with mock.patch.dict(connection.settings_dict, DISABLE_SERVER_SIDE_CURSORS=True), \
+                mock.patch('management.views.InteractionExport.chunk_size', 4):
+            response = self.assertMaxQueries(4 + self.rows ** 2 // 4, url)
+        self.assertEqual([json.loads(line)['id'] for line in response.streamed.splitlines()], ids)
+        self.assertEqual(len(ids), self.rows ** 2)
+
+    def test_project_export_jsonl(self):
+        response = self.assertMaxQueries(3, reverse('project_export') + '?format=jsonl')
+        rows = [json.loads(line) for line in response.streamed.splitlines()]
+        self.assertEqual(len(rows), self.rows ** 2)
+        self.assertEqual(rows[0]['company'], 'Company 0')
+
+    def test_unknown_format(self):
+        self.assertMaxQueries(3, reverse('project_export') + '?format=xml', status_code=404)
+
+
+class CursorPaginationTest(QueryBudgetTestCase):
+    """Keyset pagination of company lists"""
+
+    def paginate(self, query='', page_size=2):
+        view = CompanyListView()
+        view.setup(RequestFactory().get('/', QueryDict(query)))
+        return view.paginate_queryset(view.get_queryset(), page_size)
+
+    def test_ties_broken_by_pk_both_directions(self):
+        # every company is created the same day, so only pk orders them
+        pages, query = [], 'sort=-date_create&cursor='
+        while query:
+            _, page, objects, _ = self.paginate(query)
+            pages.append([company.pk for company in objects])
+            query = f'sort=-date_create&cursor={page.next_cursor}' if page.has_next() else None
+        self.assertEqual(sum(pages, []), list(Company.objects.order_by('-pk').values_list('pk', flat=True)))
+        while page.has_previous():
+            _, page, objects, _ = self.paginate(f'sort=-date_create&cursor={page.previous_cursor}')
+            self.assertEqual([company.pk for company in objects], pages[-2])
+            pages.pop()
+        self.assertEqual(len(pages), 1)
+
+    def test_invalid_cursors(self):
+        _, page, _, _ = self.paginate('cursor=')
+        token = page.next_cursor
+        foreign = signing.dumps({'v': ['Company 1', str(self.company.pk)], 'b': False}, salt='other', compress=True)
+        for cursor in (token[:-1] + ('A' if token[-1] != 'A' else 'B'), foreign):
+            with self.assertRaises(Http404):
+                self.paginate(f'cursor={cursor}')
+        with self.assertRaises(Http404):
+            self.paginate(f'sort=date_create&cursor={token}')
+
+    def test_annotation_ordering_uses_offset_pages(self):
+        view = CompanyListView()
+        view.setup(RequestFactory().get('/', {'cursor': ''}))
+        queryset = Company.objects.annotate(projects=Count('project')).order_by('-projects', 'name')
+        paginator, page, objects, _ = view.paginate_queryset(queryset, 2)
+        self.assertIsNotNone(paginator)
+        self.assertEqual(page.number, 1)
+        self.assertEqual([company.name for company in objects], ['Company 0', 'Company 1'])
+
+
+class ApiTest(QueryBudgetTestCase):
+    """Read-only JSON API of companies and projects"""
+
+    def test_company_list_sparse_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('api_company_list') + '?fields=name,phones&limit=2')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['data'][0], {'name': 'Company 0', 'phones': [f'050000000{i}' for i in range(self.rows)]})
+        company_query = next(query['sql'] for query in context.captured_queries
+                             if 'FROM "company_company"' in query['sql'])
+        self.assertNotIn('"address"', company_query)
+        next_page = self.client.get(body['next']).json()
+        self.assertEqual(next_page['data'][0]['name'], 'Company 2')
+        self.assertIsNotNone(next_page['previous'])
+
+    def test_company_list_queries(self):
+        self.assertMaxQueries(7, reverse('api_company_list'))
+
+    def test_company_detail_revalidation(self):
+        url = reverse('api_company_detail', kwargs={'pk': self.company.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.json()['data']['grade'], 3)
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as context:
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse([query for query in context.captured_queries if 'company' in query['sql']])
+        Company.objects.filter(pk=self.company.pk).update(name='Renamed')
+        Company.objects.get(pk=self.company.pk).save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(reverse('api_project_list') + '?fields=secret').status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_project_detail', kwargs={'pk': 0})).json(),
+                         {'error': 'Не найдено'})
+        self.assertEqual(self.client.post(reverse('api_project_list')).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_project_list')).status_code, 401)
+
+
+class AssetBundleTest(SimpleTestCase):
+    """collectstatic bundles vendored assets and keeps only the icons templates use"""
+
+    def test_build(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        storage = StaticFilesStorage(location=root)
+        for source in [assets.ICON_FONT, *(name for names in assets.BUNDLES.values() for name in names)]:
+            if source != assets.ICONS_CSS:
+                os.makedirs(os.path.dirname(storage.path(source)), exist_ok=True)
+                shutil.copy(finders.find(source), storage.path(source))
+        assets.build(storage)
+        css = storage.open('bundles/app.css').read().decode()
+        self.assertIn('url(icons.woff2)', css)
+        self.assertIn('.fa-users-cog:before{content:"\\f509"}', css)
+        self.assertIn('Bootstrap v5', storage.open('bundles/app.js').read().decode())
+        font = TTFont(io.BytesIO(storage.open(assets.ICONS_FONT).read()))
+        self.assertEqual(set(font.getBestCmap()), set(assets.icon_codepoints(storage.path(assets.ICON_FONT)).values()))
+        self.assertLess(storage.size(assets.ICONS_FONT), storage.size(assets.ICON_FONT) / 10)
+
+    @override_settings(ASSET_BUNDLES=True, SECURE_SSL_REDIRECT=False,
+                       STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_pages_load_bundles_only(self):
+        response = self.client.get(reverse('login'))
+        self.assertContains(response, '<link rel="stylesheet" href="/static/bundles/app.css">', html=True)
+        self.assertContains(response, 'rel="preload" href="/static/bundles/icons.woff2"')
+        self.assertNotContains(response, 'https://')
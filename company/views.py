@@ -1,14 +1,25 @@
-import stats as stats
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
+from django.views.generic import CreateView, DeleteView, DetailView, FormView, ListView, UpdateView
 from .forms import *
 from .models import Company, Project
-from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from .export import StreamingExportView
+from .importers import IMPORTERS, read_rows
+from .cache import COMPANIES, PROJECTS, CachedListMixin, FragmentCacheMixin, is_fragment_cached
+from .pagination import CursorPaginationMixin
+from .services import save_company_with_contacts
+from management.models import Interaction
+from django.contrib.auth.mixins import LoginRequiredMixin
+from crm.permissions import PermissionRequiredMixin
 
 
-class CompanyListView(LoginRequiredMixin, ListView):
+class CompanyListView(LoginRequiredMixin, CachedListMixin, CursorPaginationMixin, ListView):
     """Generic class-based view for a list of companies for authenticated users"""
     model = Company
+    cache_namespaces = (COMPANIES,)
     paginate_by = 10
     template_name = 'company/company_list.html'
     ordering = 'name'
@@ -25,95 +36,63 @@ class CompanyListView(LoginRequiredMixin, ListView):
         return context
 
 
-class CompanyDetailView(LoginRequiredMixin, DetailView):
+class CompanyDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
     """Generic class-based detail view for a company for authenticated users"""
     model = Company
     template_name = 'company/company_detail.html'
+    cache_namespaces = (COMPANIES,)
+    prefetch = ('companymanager_set', 'phone_set', 'companyemail_set', 'project_set')
 
+    def get_object(self, queryset=None):
+        """Prefetch related collections only if the detail fragment has to be rendered"""
+        obj = super(CompanyDetailView, self).get_object(queryset)
+        if not is_fragment_cached('company_detail', obj.pk, self.request.user.is_staff, self.get_cache_version()):
+            prefetch_related_objects([obj], *self.prefetch)
+        return obj
 
-class CompanyCreateView(PermissionRequiredMixin, CreateView):
+
+class CompanyContactsMixin:
+    """Build phone, email and contact person formsets once per request and save them with the company"""
+    formset_classes = {'phone_formset': PhoneFormset, 'email_formset': EmailFormSet, 'manager_formset': ManagerFormSet}
+
+    def get_formsets(self):
+        """Get formsets bound to POST data or to the current company"""
+        if not hasattr(self, 'formsets'):
+            data = self.request.POST if self.request.method == 'POST' else None
+            self.formsets = {name: formset_class(data, instance=self.object)
+                             for name, formset_class in self.formset_classes.items()}
+        return self.formsets
+
+    def get_context_data(self, **kwargs):
+        """Add formsets' data to company's context"""
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_formsets())
+        return context
+
+    def form_valid(self, form):
+        """Check formsets and save company with contacts in one transaction"""
+        formsets = self.get_formsets().values()
+        if not all([formset.is_valid() for formset in formsets]):
+            return self.form_invalid(form)
+        self.object = save_company_with_contacts(form, formsets)
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class CompanyCreateView(PermissionRequiredMixin, CompanyContactsMixin, CreateView):
     """Create new company only if user can add company"""
     model = Company
     form_class = CompanyForm
     template_name = 'company/company_create.html'
     permission_required = 'company.add_company'
 
-    def get_context_data(self, **kwargs):
-        """Add formsets' data to company's context"""
-        context = super(CompanyCreateView, self).get_context_data(**kwargs)
-        if self.request.POST:
-            context['phone_formset'] = PhoneFormset(self.request.POST, instance=self.object)
-            context['email_formset'] = EmailFormSet(self.request.POST, instance=self.object)
-            context['manager_formset'] = ManagerFormSet(self.request.POST, instance=self.object)
-            context['phone_formset'].full_clean()
-            context['email_formset'].full_clean()
-            context['manager_formset'].full_clean()
-        else:
-            context['phone_formset'] = PhoneFormset(instance=self.object)
-            context['email_formset'] = EmailFormSet(instance=self.object)
-            context['manager_formset'] = ManagerFormSet(instance=self.object)
-        return context
 
-    def form_valid(self, form):
-        """Check if form valid"""
-        context = self.get_context_data(form=form)
-        phone_formset = context['phone_formset']
-        email_formset = context['email_formset']
-        manager_formset = context['manager_formset']
-        if phone_formset.is_valid() and email_formset.is_valid() and manager_formset.is_valid():
-            response = super().form_valid(form)
-            phone_formset.instance = self.object
-            phone_formset.save()
-            email_formset.instance = self.object
-            email_formset.save()
-            manager_formset.instance = self.object
-            manager_formset.save()
-            return response
-        else:
-            return super().form_invalid(form)
-
-
-class CompanyUpdateView(PermissionRequiredMixin, UpdateView):
+class CompanyUpdateView(PermissionRequiredMixin, CompanyContactsMixin, UpdateView):
     """Update current company view if user can change data of company"""
     model = Company
     fields = '__all__'
     template_name = 'company/company_update.html'
     permission_required = 'company.change_company'
 
-    def get_context_data(self, **kwargs):
-        """Add formsets' data to company's context"""
-        context = super(CompanyUpdateView, self).get_context_data(**kwargs)
-        if self.request.POST:
-            context['phone_formset'] = PhoneFormset(self.request.POST, instance=self.object)
-            context['email_formset'] = EmailFormSet(self.request.POST, instance=self.object)
-            context['manager_formset'] = ManagerFormSet(self.request.POST, instance=self.object)
-            context['phone_formset'].full_clean()
-            context['email_formset'].full_clean()
-            context['manager_formset'].full_clean()
-        else:
-            context['phone_formset'] = PhoneFormset(instance=self.object)
-            context['email_formset'] = EmailFormSet(instance=self.object)
-            context['manager_formset'] = ManagerFormSet(instance=self.object)
-        return context
-
-    def form_valid(self, form):
-        """Check if form and formsets are valid"""
-        context = self.get_context_data(form=form)
-        phone_formset = context['phone_formset']
-        email_formset = context['email_formset']
-        manager_formset = context['manager_formset']
-        if phone_formset.is_valid() and email_formset.is_valid() and manager_formset.is_valid():
-            response = super().form_valid(form)
-            phone_formset.instance = self.object
-            phone_formset.save()
-            email_formset.instance = self.object
-            email_formset.save()
-            manager_formset.instance = self.object
-            manager_formset.save()
-            return response
-        else:
-            return super().form_invalid(form)
-
 
 class CompanyDeleteView(PermissionRequiredMixin, DeleteView):
     """Delete current company if user can change company"""
@@ -123,19 +102,77 @@ class CompanyDeleteView(PermissionRequiredMixin, DeleteView):
     permission_required = 'company.change_company'
 
 
-class ProjectListView(LoginRequiredMixin, ListView):
+class CompanyImportView(PermissionRequiredMixin, FormView):
+    """Staff upload of a CSV or XLSX file with companies or projects"""
+    form_class = ImportForm
+    template_name = 'company/company_import.html'
+    permission_required = ('company.add_company', 'company.add_project')
+
+    def form_valid(self, form):
+        """Import the file and show created counts and rejected rows"""
+        file = form.cleaned_data['file']
+        importer = IMPORTERS[form.cleaned_data['kind']]()
+        try:
+            report = importer.run(read_rows(file, file.name))
+        except ValidationError as error:
+            form.add_error('file', error)
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, report=report))
+
+
+class CompanyExportView(PermissionRequiredMixin, StreamingExportView):
+    """Stream all companies with contacts as CSV or JSON Lines"""
+    queryset = Company.objects.order_by('pk')
+    permission_required = 'company.view_company'
+    export_name = 'companies'
+    export_prefetch = ('phone_set', 'companyemail_set', 'companymanager_set')
+    export_fields = {
+        'id': 'pk',
+        'name': 'name',
+        'address': 'address',
+        'description': 'description',
+        'date_create': 'date_create',
+        'date_edit': 'date_edit',
+        'phones': lambda company: '; '.join(phone.phone for phone in company.phone_set.all()),
+        'emails': lambda company: '; '.join(email.company_email for email in company.companyemail_set.all()),
+        'contacts': lambda company: '; '.join(f'{contact} - {contact.manager_position}'
+                                              for contact in company.companymanager_set.all()),
+    }
+
+
+class ProjectListView(LoginRequiredMixin, CachedListMixin, CursorPaginationMixin, ListView):
     """Generic class-based view for a list of projects for authenticated users"""
     model = Project
+    cache_namespaces = (PROJECTS,)
     paginate_by = 10
     template_name = 'company/project_list.html'
+    ordering = 'pk'
 
 
-class ProjectDetailView(LoginRequiredMixin, DetailView):
+class ProjectDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
     """Detail view of a project for authenticated users"""
     model = Project
+    queryset = Project.objects.select_related('company')
+    cache_namespaces = (PROJECTS,)
     template_name = 'company/project_detail.html'
 
 
+class ProjectExportView(PermissionRequiredMixin, StreamingExportView):
+    """Stream all projects as CSV or JSON Lines"""
+    queryset = Project.objects.select_related('company').order_by('pk')
+    permission_required = 'company.view_project'
+    export_name = 'projects'
+    export_fields = {
+        'id': 'pk',
+        'project': 'project',
+        'company': 'company.name',
+        'description': 'description',
+        'start_date': 'start_date',
+        'final_date': 'final_date',
+        'price': 'price',
+    }
+
+
 class ProjectCreateView(PermissionRequiredMixin, CreateView):
     """Create a new project if user can add project"""
     model = Project
@@ -162,42 +199,50 @@ class ProjectDeleteView(PermissionRequiredMixin, DeleteView):
         return reverse_lazy('company_detail', kwargs={'pk': self.object.company_id})
 
 
-class InteractionByCompanyList(PermissionRequiredMixin, ListView):
+class InteractionAggregateMixin:
+    """Paginate interactions of one object in SQL and add its stored statistics to context"""
+    owner_field = None
+    context_owner_name = None
+
+    def get_owner(self):
+        """Get the company or project whose interactions are listed"""
+        if getattr(self, 'model', None) is None:
+            raise ImproperlyConfigured(f'{type(self).__name__} is missing the model of the owner.')
+        if not hasattr(self, 'owner'):
+            self.owner = get_object_or_404(self.model.objects.select_related('stats'), pk=self.kwargs['pk'])
+        return self.owner
+
+    def get_queryset(self):
+        """Get interactions of the owner with related rows joined in one query"""
+        return Interaction.objects.filter(**{self.owner_field: self.get_owner()}) \
+            .select_related('project', 'company').order_by('-pk')
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        """Add owner, average grade and per-channel counts from stored statistics to context data"""
+        context = super().get_context_data(object_list=object_list, **kwargs)
+        owner = self.get_owner()
+        stats = getattr(owner, 'stats', None)
+        context[self.context_owner_name] = owner
+        context['grade'] = stats.grade if stats else None
+        context['channel_counts'] = stats.channel_counts() if stats else []
+        return context
+
+
+class InteractionByCompanyList(PermissionRequiredMixin, InteractionAggregateMixin, ListView):
     """Representing a list of interactions for current company"""
     model = Company
+    owner_field = 'company'
+    context_owner_name = 'company'
     permission_required = 'management.view_interaction'
     template_name = 'company/interaction_by_company_list.html'
     paginate_by = 10
 
-    def get_queryset(self):
-        """Get queryset for current company"""
-        qs = Company.objects.prefetch_related('interactions').filter(pk=self.kwargs['pk'])
-        obj_list = []
-        for obj in qs:
-            grade = str(round(stats.mean([interaction.grade for interaction in obj.interactions.all()]), 2))
-            channel = [interaction.channel for interaction in obj.interactions.all()]
-            pk = [interaction.pk for interaction in obj.interactions.all()]
-            project = [interaction.project for interaction in obj.interactions.all()]
-            for i in range(len(obj.interactions.all())):
-                obj_list.append({'id': obj.id, 'name': obj.name, 'grade': grade, 'project': project[i], 'channel': channel[i], 'pk': str(pk[i])})
-        return obj_list
-
-
-class InteractionByProjectList(PermissionRequiredMixin, ListView):
+
+class InteractionByProjectList(PermissionRequiredMixin, InteractionAggregateMixin, ListView):
     """Representing a list of interactions for current project"""
     model = Project
+    owner_field = 'project'
+    context_owner_name = 'project'
     permission_required = 'management.view_interaction'
     template_name = 'company/interactions_by_project.html'
     paginate_by = 10
-
-    def get_queryset(self):
-        """Get queryset for current project"""
-        qs = Project.objects.prefetch_related('interactions').filter(pk=self.kwargs['pk'])
-        obj_list = []
-        for obj in qs:
-            channel = [interaction.channel for interaction in obj.interactions.all()]
-            pk = [interaction.pk for interaction in obj.interactions.all()]
-            for i in range(len(obj.interactions.all())):
-                obj_list.append({'id': obj.id, 'name': obj.project, 'company': obj.company.name, 'channel': channel[i], 'pk': str(pk[i])})
-        return obj_list
-
@@ -0,0 +1,220 @@
+"""
+Read-only JSON API.
+
+Resources declare the fields they expose. The ``fields`` parameter picks a
+subset, and the queryset is planned from it: only the needed columns are
+selected, forward relations are joined and reverse relations are prefetched.
+Lists use keyset pagination, orderings a cursor cannot express (search
+rank) fall back to numbered pages and their links. Every response carries an ETag built from cache
+namespace versions, so a revalidation answers 304 without touching the
+database.
+"""
+import datetime
+import hashlib
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+from django.views.generic.detail import SingleObjectMixin
+from django.views.generic.list import MultipleObjectMixin
+from company.cache import get_versions
+from company.pagination import CursorPaginationMixin
+from crm.permissions import PermissionRequiredMixin
+
+
+class ApiError(Exception):
+    """Client error answered with a JSON message"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Field:
+    """Model attribute, a dotted path follows forward relations joined with select_related"""
+
+    def __init__(self, path, columns=None, format=None):
+        self.parts = path.split('.')
+        self.columns = columns or ['__'.join(self.parts)]
+        self.format = format
+
+    def plan(self, queryset):
+        if len(self.parts) > 1:
+            queryset = queryset.select_related('__'.join(self.parts[:-1]))
+        return queryset, self.columns
+
+    def get_value(self, obj):
+        try:
+            for part in self.parts:
+                obj = getattr(obj, part) if obj is not None else None
+        except ObjectDoesNotExist:
+            return None
+        return self.format(obj) if self.format and obj is not None else obj
+
+
+class Related:
+    """Reverse foreign key loaded with one prefetch query as a list of values or of dicts"""
+
+    def __init__(self, accessor, *attrs):
+        self.accessor = accessor
+        self.attrs = attrs
+
+    def plan(self, queryset):
+        rel = getattr(queryset.model, self.accessor).rel
+        related = rel.related_model.objects.only(rel.field.name, *self.attrs).order_by('pk')
+        return queryset.prefetch_related(Prefetch(self.accessor, queryset=related)), []
+
+    def get_value(self, obj):
+        items = getattr(obj, self.accessor).all()
+        if len(self.attrs) == 1:
+            return [getattr(item, self.attrs[0]) for item in items]
+        return [{attr: getattr(item, attr) for attr in self.attrs} for item in items]
+
+
+class ApiMixin(PermissionRequiredMixin):
+    """Sparse fieldsets, JSON errors and ETag revalidation for read-only resources
+
+    Without permission_required any authenticated user is allowed.
+    """
+    http_method_names = ['get', 'head', 'options']
+    raise_exception = True
+    permission_required = ()
+    fields = {}
+    cache_namespaces = ()
+    last_modified_field = None
+
+    def has_permission(self):
+        return self.request.user.is_authenticated and super().has_permission()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except PermissionDenied:
+            status = 403 if request.user.is_authenticated else 401
+            return self.error('Недостаточно прав' if status == 403 else 'Требуется авторизация', status)
+        except Http404:
+            return self.error('Не найдено', 404)
+        except ApiError as error:
+            return self.error(str(error), error.status)
+
+    @staticmethod
+    def error(message, status):
+        return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+    def get_field_names(self):
+        """Get names from the fields parameter or all fields"""
+        names = [name.strip() for name in self.request.GET.get('fields', '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(self.fields)}')
+        return names or list(self.fields)
+
+    def plan_queryset(self, queryset):
+        """Select only the columns and relations of requested fields"""
+        columns = [self.last_modified_field] if self.last_modified_field else []
+        for name in self.field_names:
+            queryset, field_columns = self.fields[name].plan(queryset)
+            columns.extend(field_columns)
+        return queryset.only(*columns)
+
+    def get_queryset(self):
+        return self.plan_queryset(super().get_queryset())
+
+    def serialize(self, obj):
+        return {name: self.fields[name].get_value(obj) for name in self.field_names}
+
+    def get_etag(self):
+        """Tag changing with the URL, the user and the versions of namespaces the resource reads"""
+        request = self.request
+        raw = f'{request.get_full_path()}:{request.user.pk}:{get_versions(*self.cache_namespaces)}'
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+    @staticmethod
+    def get_last_modified(objects, field):
+        dates = [getattr(obj, field) for obj in objects]
+        dates = [value for value in dates if value is not None]
+        if not dates:
+            return None
+        latest = max(dates)
+        if not isinstance(latest, datetime.datetime):
+            latest = datetime.datetime.combine(latest, datetime.time.min, datetime.timezone.utc)
+        return http_date(latest.timestamp())
+
+    def get(self, request, *args, **kwargs):
+        """Answer 304 when the client has the current ETag, otherwise run queries and render JSON
+
+        Last-Modified is informational only: the date fields have a day
+        precision, so If-Modified-Since would hide edits made the same day.
+        """
+        self.field_names = self.get_field_names()
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data, objects = self.get_data()
+            response = JsonResponse(data, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
+            if self.last_modified_field:
+                last_modified = self.get_last_modified(objects, self.last_modified_field)
+                if last_modified:
+                    response['Last-Modified'] = last_modified
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    def get_data(self):
+        """Get JSON body and serialized objects"""
+        raise NotImplementedError
+
+
+class ApiListView(ApiMixin, CursorPaginationMixin, MultipleObjectMixin, View):
+    """Keyset paginated list of a resource"""
+    paginate_by = 50
+    max_paginate_by = 200
+
+    def use_cursor_pagination(self):
+        return True
+
+    def get_paginate_by(self, queryset):
+        try:
+            limit = int(self.request.GET.get('limit', self.paginate_by))
+        except ValueError:
+            raise ApiError('Параметр limit должен быть числом')
+        return max(1, min(limit, self.max_paginate_by))
+
+    def get_page_url(self, param, value):
+        if value is None:
+            return None
+        params = self.request.GET.copy()
+        params.pop(self.cursor_param, None)
+        params.pop(self.page_kwarg, None)
+        params[param] = value
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def get_page_links(self, page):
+        """Get URLs of the next and previous pages, numbered pages when the ordering has no cursor"""
+        if getattr(page, 'is_cursor', False):
+            return (self.get_page_url(self.cursor_param, page.next_cursor),
+                    self.get_page_url(self.cursor_param, page.previous_cursor))
+        return (self.get_page_url(self.page_kwarg, page.next_page_number() if page.has_next() else None),
+                self.get_page_url(self.page_kwarg, page.previous_page_number() if page.has_previous() else None))
+
+    def get_data(self):
+        queryset = self.get_queryset()
+        _, page, objects, _ = self.paginate_queryset(queryset, self.get_paginate_by(queryset))
+        next_url, previous_url = self.get_page_links(page)
+        return {
+            'data': [self.serialize(obj) for obj in objects],
+            'next': next_url,
+            'previous': previous_url,
+        }, objects
+
+
+class ApiDetailView(ApiMixin, SingleObjectMixin, View):
+    """Single object of a resource"""
+
+    def get_data(self):
+        obj = self.get_object()
+        return {'data': self.serialize(obj)}, [obj]
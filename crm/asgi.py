@@ -2,6 +2,11 @@
 ASGI config for crm project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Interaction lists and detail pages are served by async views here, set
+ASYNC_VIEWS=off to serve the sync ones. Streaming exports are read outside
+the event loop by crm.asynchronous.ASGIHandler. Run it with an ASGI server, e.g.
+
+    gunicorn crm.asgi:application -k uvicorn.workers.UvicornWorker
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +14,13 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crm.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'on')
+
+django.setup(set_prefix=False)
+
+from crm.asynchronous import ASGIHandler  # noqa: E402
 
-application = get_asgi_application()
+application = ASGIHandler()
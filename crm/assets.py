@@ -0,0 +1,150 @@
+"""
+Static asset bundles.
+
+Bootstrap and the Font Awesome solid font are vendored in company/static/vendor,
+pages load nothing from third-party hosts. collectstatic builds BUNDLES: the
+icons templates use are cut from the font into bundles/icons.woff2, CSS and
+JS sources are concatenated and minified, then the manifest storage hashes
+the names and WhiteNoise writes gzip and Brotli variants. Without
+ASSET_BUNDLES (development) templates link the sources and the full font.
+"""
+import functools
+import io
+import os
+import posixpath
+import re
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.base import ContentFile
+from django.template.utils import get_app_template_dirs
+from django.templatetags.static import static
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+ICON_FONT = 'vendor/fontawesome/fa-solid-900.woff2'
+ICONS_CSS = 'bundles/icons.css'
+ICONS_FONT = 'bundles/icons.woff2'
+BUNDLES = {
+    'bundles/app.css': ['vendor/bootstrap/bootstrap.min.css', ICONS_CSS, 'styles.css'],
+    'bundles/app.js': ['vendor/bootstrap/popper.min.js', 'vendor/bootstrap/bootstrap.min.js'],
+}
+ICON_CLASS = re.compile(r'\bfa-([a-z0-9-]+)')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+ICON_RULES = (
+    '/*! Font Awesome Free 5.15.4 by @fontawesome - https://fontawesome.com, '
+    'License - https://fontawesome.com/license/free (Icons: CC BY 4.0, Fonts: SIL OFL 1.1, Code: MIT License) */\n'
+    '@font-face{font-family:"Font Awesome 5 Free";font-style:normal;font-weight:900;font-display:block;'
+    'src:url(%s) format("woff2")}\n'
+    '.fa,.fas{-moz-osx-font-smoothing:grayscale;-webkit-font-smoothing:antialiased;display:inline-block;'
+    'font-style:normal;font-variant:normal;text-rendering:auto;line-height:1;'
+    'font-family:"Font Awesome 5 Free";font-weight:900}\n'
+)
+
+
+def used_icons():
+    """Get names of fa-* classes found in templates, size and other modifiers included"""
+    directories = [*settings.TEMPLATES[0]['DIRS'], *get_app_template_dirs('templates')]
+    names = set()
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if file.endswith('.html'):
+                    with open(os.path.join(root, file), encoding='utf-8') as template:
+                        names.update(ICON_CLASS.findall(template.read()))
+    return names
+
+
+@functools.lru_cache()
+def font_codepoints(path):
+    """Map glyph names of the icon font, which are icon names, to code points"""
+    from fontTools.ttLib import TTFont
+    return {name: codepoint for codepoint, name in TTFont(path).getBestCmap().items()}
+
+
+def icon_codepoints(font_path):
+    """Get code points of icons used by templates, modifier classes have no glyph"""
+    codepoints = font_codepoints(font_path)
+    return {name: codepoints[name] for name in sorted(used_icons()) if name in codepoints}
+
+
+def icon_css(font_url, codepoints):
+    rules = ''.join(f'.fa-{name}:before{{content:"\\{codepoint:x}"}}' for name, codepoint in codepoints.items())
+    return ICON_RULES % font_url + rules
+
+
+def subset_font(font_path, codepoints):
+    """Get WOFF2 font with glyphs of the code points only"""
+    from fontTools import subset
+    options = subset.Options()
+    options.flavor = 'woff2'
+    options.drop_tables.append('FFTM')
+    font = subset.load_font(font_path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    output = io.BytesIO()
+    subset.save_font(font, output, options)
+    return output.getvalue()
+
+
+def rebase_urls(css, source, bundle):
+    """Make relative url() of a source stylesheet relative to the bundle"""
+
+    def rebase(match):
+        url = match.group(2)
+        if url.startswith(('/', '#', 'data:')) or '://' in url:
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return f'url({posixpath.relpath(target, posixpath.dirname(bundle))})'
+
+    return CSS_URL.sub(rebase, css)
+
+
+def write(storage, name, content):
+    """Replace a generated file of the previous build"""
+    storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def build(storage):
+    """Write the icon subset and the bundles into collected static files, return their names"""
+    import rcssmin
+    import rjsmin
+    codepoints = icon_codepoints(storage.path(ICON_FONT))
+    write(storage, ICONS_FONT, subset_font(storage.path(ICON_FONT), codepoints.values()))
+    write(storage, ICONS_CSS, icon_css(posixpath.basename(ICONS_FONT), codepoints).encode())
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with storage.open(source) as file:
+                content = file.read().decode('utf-8')
+            parts.append(rebase_urls(content, source, bundle) if bundle.endswith('.css') else content)
+        if bundle.endswith('.css'):
+            content = rcssmin.cssmin('\n'.join(parts), keep_bang_comments=True)
+        else:
+            content = rjsmin.jsmin(';\n'.join(parts), keep_bang_comments=True)
+        write(storage, bundle, content.encode())
+    return [ICONS_FONT, ICONS_CSS, *BUNDLES]
+
+
+class BundleStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Build bundles before collected files are hashed and compressed"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for name in build(self):
+                paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run, **options)
+
+
+def source_tags(bundle):
+    """Tags of bundle sources for development, icon rules use the full font"""
+    tags = []
+    for source in BUNDLES[bundle]:
+        if source == ICONS_CSS:
+            tags.append(f'<style>{icon_css(static(ICON_FONT), icon_codepoints(finders.find(ICON_FONT)))}</style>')
+        elif bundle.endswith('.css'):
+            tags.append(f'<link rel="stylesheet" href="{static(source)}">')
+        else:
+            tags.append(f'<script src="{static(source)}"></script>')
+    return tags
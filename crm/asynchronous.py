@@ -0,0 +1,154 @@
+"""
+Async serving mode.
+
+Django 3.2 has no async ORM, so async views hand every blocking step to a
+bounded thread pool with run_in_pool and await the result, independent
+queries of a page run concurrently. The pool size caps database
+connections opened by a process, the event loop stays free for other
+requests while queries run.
+
+Django 3.2 iterates streaming responses on the event loop, where the
+queries of export generators are refused, so ASGIHandler reads them in the
+thread sync views run in.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import close_old_connections
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+from . import metrics
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix='crm-db')
+        return _pool
+
+
+def call_in_pool(func, *args, **kwargs):
+    """Run func in a pool thread closing connections that are broken or older than CONN_MAX_AGE"""
+    close_old_connections()
+    try:
+        with metrics.track_queries():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """Await blocking func in the database pool, context variables are kept
+
+    With ASYNC_DB_THREADS = 0 func runs in the thread-sensitive thread like
+    sync views do, tests need it to see data of their transaction.
+    """
+    if not settings.ASYNC_DB_THREADS:
+        return await sync_to_async(call_in_pool, thread_sensitive=True)(func, *args, **kwargs)
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, call_in_pool, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), call)
+
+
+def evaluate_page(context):
+    """Fetch rows of the current page so rendering runs no queries"""
+    page = context.get('page_obj')
+    if page is not None:
+        page.object_list = list(page.object_list)
+        context['object_list'] = page.object_list
+    elif context.get('object_list') is not None:
+        context['object_list'] = list(context['object_list'])
+    return context
+
+
+class AsyncViewMixin:
+    """Serve a class-based view as a coroutine
+
+    Access checks and sync handlers run in the pool, async handlers are
+    awaited on the event loop.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await run_in_pool(super().dispatch, request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise that does not force the whole middleware chain into sync mode under ASGI
+
+    Static files are looked up in memory, so the lookup runs on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            return await sync_to_async(super().__call__, thread_sensitive=True)(request)
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+
+def read_parts(parts, size):
+    """Join parts of a streaming response up to about size bytes, empty when they are exhausted"""
+    data, length = [], 0
+    for part in parts:
+        data.append(part)
+        length += len(part)
+        if length >= size:
+            break
+    return b''.join(data)
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """ASGI handler reading streaming responses outside the event loop"""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        headers += [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        # one thread keeps the generator on one database connection, batches save a thread hop per row
+        read = sync_to_async(read_parts, thread_sensitive=True)
+        parts = iter(response)
+        while True:
+            data = await read(parts, self.chunk_size)
+            if not data:
+                break
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,6 @@
+from django.db.backends.postgresql import base
+from crm.database import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    """PostgreSQL with health checks of reused connections"""
@@ -0,0 +1,115 @@
+"""
+Read replica routing and connection health checks.
+
+Requests with safe methods read from an alias of DATABASE_REPLICAS, writes
+and all other requests use the primary. After a client's POST a cookie keeps
+that client's reads on the primary for REPLICA_PIN_SECONDS, other clients
+keep reading replicas. A page another client renders from a replica that
+has not applied a write yet can be cached under the new namespace versions,
+it is replaced by the next write to its namespaces or after PAGE_CACHE_TIMEOUT.
+
+With CONN_HEALTH_CHECKS the middleware marks connections at the start of a
+request and HealthCheckMixin of the database wrapper (crm.backends) checks a
+reused one only before its first query.
+"""
+import asyncio
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.decorators import sync_and_async_middleware
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+read_alias = ContextVar('read_alias', default=None)
+
+
+def choose_read_alias(request):
+    """Get a replica for the request or None for the primary"""
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return None
+    if PIN_COOKIE in request.COOKIES:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def check_connections():
+    """Have persistent connections checked before their first query of the request"""
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            connection.health_check_done = False
+
+
+class HealthCheckMixin:
+    """Close a broken reused connection before its first cursor of a request, like CONN_HEALTH_CHECKS of Django 4.1
+
+    Requests that run no query or open a new connection skip the check.
+    """
+    health_check_done = True
+
+    def _cursor(self, name=None):
+        if not self.health_check_done:
+            self.health_check_done = True
+            if self.connection is not None and not self.in_atomic_block and not self.is_usable():
+                self.close()
+        return super()._cursor(name)
+
+
+class ReplicaRouter:
+    """Route reads to the replica chosen for the current request"""
+
+    def db_for_read(self, model, **hints):
+        """The database cache holds invalidation versions, a lagging replica would serve old ones"""
+        if model._meta.app_label == 'django_cache':
+            return 'default'
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        """Replicas get the schema from the primary"""
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+@sync_and_async_middleware
+def database_middleware(get_response):
+    """Check persistent connections and pick the read alias of each request"""
+    health_checks = any(database.get('CONN_HEALTH_CHECKS') for database in settings.DATABASES.values())
+    if not settings.DATABASE_REPLICAS and not health_checks:
+        raise MiddlewareNotUsed
+
+    def start(request):
+        return read_alias.set(choose_read_alias(request))
+
+    def finish(request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, secure=request.is_secure(),
+                                httponly=True, samesite='Lax')
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            """Connections of async views live in pool threads, not in the event loop"""
+            token = start(request)
+            try:
+                response = await get_response(request)
+            finally:
+                read_alias.reset(token)
+            return finish(request, response)
+    else:
+        def middleware(request):
+            if health_checks:
+                check_connections()
+            token = start(request)
+            try:
+                response = get_response(request)
+            finally:
+                read_alias.reset(token)
+            return finish(request, response)
+    return middleware
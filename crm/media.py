@@ -0,0 +1,238 @@
+"""
+Processing of uploaded images.
+
+Manager photos and CKEditor images are checked against UPLOAD_MAX_BYTES
+and, using the image header only, against UPLOAD_MAX_PIXELS before any
+pixels are decoded. Large images are decoded downscaled to fit
+UPLOAD_MAX_DIMENSION, so a 40 megapixel photo never lives in a worker's
+memory at full size. The result has no metadata. It is encoded in the
+first format of UPLOAD_IMAGE_FORMATS that Pillow can write, and it is named
+by the hash of its content, so identical uploads share one file on disk.
+
+Media files are served by serve(). Content addressed files and thumbnails
+never change, so they are cached by browsers as immutable. With
+MEDIA_SENDFILE the transfer is handed to nginx (X-Accel-Redirect) or to an
+Apache/lighttpd module (X-Sendfile). Otherwise the file is served in process
+with Range support, and wsgi.file_wrapper of gunicorn sends it with
+sendfile() instead of reading it in Python.
+"""
+import hashlib
+import io
+import mimetypes
+import os
+import posixpath
+import re
+from PIL import Image, ImageOps
+from ckeditor_uploader import utils as ckeditor_utils
+from ckeditor_uploader.views import ImageUploadView as BaseImageUploadView
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.template.defaultfilters import filesizeformat
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.html import escape
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP', 'BMP', 'TIFF')
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+SAVE_OPTIONS = {
+    'AVIF': {},
+    'WEBP': {'method': 4},
+    'JPEG': {'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{64}\.\w+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage keeping one file per content, names come from process_image
+
+    Files may be shared, so they are deleted by garbage collection only.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is not None and self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+def get_output_format(has_alpha):
+    """Get the first configured format Pillow can write, PNG keeps transparency JPEG lacks"""
+    Image.init()
+    for image_format in settings.UPLOAD_IMAGE_FORMATS:
+        if image_format in Image.SAVE:
+            return 'PNG' if has_alpha and image_format == 'JPEG' else image_format
+    raise ValueError('None of UPLOAD_IMAGE_FORMATS is supported by Pillow')
+
+
+def process_image(file):
+    """Check limits, downscale, strip metadata and re-encode an uploaded image
+
+    Return a ContentFile named like ``ab/<sha256>.webp``.
+    """
+    if file.size > settings.UPLOAD_MAX_BYTES:
+        raise ValidationError(f'Размер файла больше {filesizeformat(settings.UPLOAD_MAX_BYTES)}')
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError('Загрузите корректное изображение')
+    if image.format not in ALLOWED_FORMATS:
+        raise ValidationError(f'Формат {image.format} не поддерживается')
+    width, height = image.size
+    if width * height > settings.UPLOAD_MAX_PIXELS:
+        raise ValidationError(f'Изображение больше {settings.UPLOAD_MAX_PIXELS // 1000000} Мп')
+    size = (settings.UPLOAD_MAX_DIMENSION, settings.UPLOAD_MAX_DIMENSION)
+    try:
+        # JPEG is decoded at 1/2..1/8 scale with draft(), other formats are shrunk with reduce() before resampling
+        image.thumbnail(size, Image.LANCZOS, reducing_gap=3.0)
+        image = ImageOps.exif_transpose(image)
+    except (OSError, SyntaxError):
+        raise ValidationError('Загрузите корректное изображение')
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    image.info = {}
+    image_format = get_output_format(has_alpha)
+    output = io.BytesIO()
+    image.save(output, image_format, quality=settings.UPLOAD_IMAGE_QUALITY, **SAVE_OPTIONS[image_format])
+    digest = hashlib.sha256(output.getvalue()).hexdigest()
+    return ContentFile(output.getvalue(), name=f'{digest[:2]}/{digest}.{EXTENSIONS[image_format]}')
+
+
+class ImageUploadView(BaseImageUploadView):
+    """CKEditor upload that processes images and stores them once per content"""
+    storage = ContentAddressedStorage()
+
+    def post(self, request, **kwargs):
+        upload = request.FILES.get('upload')
+        if upload is None or not ckeditor_utils.is_valid_image_extension(upload.name):
+            return super().post(request, **kwargs)
+        func_num = escape(request.GET.get('CKEditorFuncNum', ''))
+        try:
+            image = process_image(upload)
+        except ValidationError as error:
+            return self.respond(func_num, error=error.messages[0])
+        name = self.storage.save(posixpath.join(settings.CKEDITOR_UPLOAD_PATH, image.name), image)
+        return self.respond(func_num, url=self.storage.url(name), name=name)
+
+    @staticmethod
+    def respond(func_num, url='', name='', error=''):
+        """Answer the way ckeditor_uploader does: a script for the dialog, JSON for drag and drop"""
+        if func_num:
+            return HttpResponse(
+                "<script type='text/javascript'>"
+                f"window.parent.CKEDITOR.tools.callFunction({func_num}, '{escape(url)}', '{escape(error)}');"
+                "</script>"
+            )
+        if error:
+            return JsonResponse({'uploaded': 0, 'error': {'message': error}})
+        return JsonResponse({'url': url, 'uploaded': '1', 'fileName': posixpath.basename(name)})
+
+
+upload = csrf_exempt(ImageUploadView.as_view())
+
+
+class FileSlice:
+    """Part of an open file, fileno() lets wsgi.file_wrapper send it with sendfile()"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def is_immutable(name):
+    """Content addressed uploads and thumbnails are never rewritten under the same name"""
+    return bool(HASHED_NAME.search(name)) or name.startswith(thumbnail_settings.THUMBNAIL_PREFIX)
+
+
+def parse_range(header, size):
+    """Get (start, length) of a single byte range, None to send the whole file
+
+    Raise ValueError for a range outside of the file.
+    """
+    match = RANGE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        length = min(int(end), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+@require_safe
+def serve(request, path):
+    """Serve a file of MEDIA_ROOT with cache headers and byte ranges"""
+    full_path = safe_join(settings.MEDIA_ROOT, path)
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = http_date(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = send_file(request, path, full_path, stat.st_size, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = IMMUTABLE if is_immutable(path) else f'public, max-age={settings.MEDIA_MAX_AGE}'
+    return response
+
+
+def send_file(request, path, full_path, size, etag):
+    """Hand the file to the web server or stream the requested range of it"""
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+        return response
+    if settings.MEDIA_SENDFILE == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    start, length = byte_range or (0, size)
+    response = FileResponse(FileSlice(open(full_path, 'rb'), start, length), content_type=content_type)
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,240 @@
+"""
+Per-request performance metrics.
+
+PerformanceMetricsMiddleware measures every request and stores the samples
+per resolved URL name in an in-process registry. Staff can read the registry
+as JSON or Prometheus text. The Server-Timing header exposes database time
+and query counts, so it is sent with DEBUG or SERVER_TIMING and otherwise
+only to staff.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from django.utils.functional import empty
+
+INF = float('inf')
+TIME_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, INF)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, INF)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, INF)
+METRICS = {
+    'wall_ms': TIME_BUCKETS,
+    'db_ms': TIME_BUCKETS,
+    'template_ms': TIME_BUCKETS,
+    'queries': COUNT_BUCKETS,
+    'duplicate_queries': COUNT_BUCKETS,
+    'response_bytes': SIZE_BUCKETS,
+}
+
+
+class Histogram:
+    """Cumulative bucket counts plus a rolling window of recent values for percentiles"""
+
+    def __init__(self, buckets, window):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, value):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * value))], 2)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 2) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe storage of histograms per view"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.views = defaultdict(self.new_view)
+
+    def new_view(self):
+        return {name: Histogram(buckets, self.window) for name, buckets in METRICS.items()}
+
+    def record(self, view, sample):
+        with self.lock:
+            histograms = self.views[view]
+            for name, value in sample.items():
+                histograms[name].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return {view: {name: histogram.as_dict() for name, histogram in histograms.items()}
+                    for view, histograms in self.views.items()}
+
+    def prometheus(self):
+        """Render all histograms in Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name in METRICS:
+                metric = f'crm_request_{name}'
+                lines.append(f'# TYPE {metric} histogram')
+                for view, histograms in sorted(self.views.items()):
+                    histogram = histograms[name]
+                    cumulative = 0
+                    for bucket, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bucket == INF else f'{bucket:g}'
+                        lines.append(f'{metric}_bucket{{view="{view}",le="{le}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum:g}')
+                    lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(window=getattr(settings, 'PERFORMANCE_METRICS_WINDOW', 1000))
+
+
+class QueryTimer:
+    """Database execute wrapper summing query time and counting repeated statements"""
+
+    def __init__(self):
+        self.duration = 0
+        self.statements = []
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.duration += time.perf_counter() - start
+                self.statements.append(sql)
+
+
+current_timer = ContextVar('current_timer', default=None)
+
+
+@contextmanager
+def track_queries():
+    """Send queries of this thread's connections to the timer of the current request"""
+    timer = current_timer.get()
+    with ExitStack() as stack:
+        if timer is not None:
+            for connection in connections.all():
+                if timer not in connection.execute_wrappers:
+                    stack.enter_context(connection.execute_wrapper(timer))
+        yield
+
+
+def show_server_timing(request):
+    """Check whether the response gets Server-Timing, users the request did not load are not loaded for it"""
+    if settings.DEBUG or getattr(settings, 'SERVER_TIMING', False):
+        return True
+    user = getattr(request, 'user', None)
+    if user is None or getattr(user, '_wrapped', None) is empty:
+        return False
+    return user.is_staff
+
+
+class PerformanceMetricsMiddleware:
+    """Record wall, database and template time, query counts and response size per URL name"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFORMANCE_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timer, token, start = self.start(request)
+        try:
+            with track_queries():
+                response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        """Queries of async views run in pool threads which pick the timer from the context"""
+        timer, token, start = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.finish(request, response, timer, start)
+
+    @staticmethod
+    def start(request):
+        timer = QueryTimer()
+        request._template_timing = [0.0, None]
+        return timer, current_timer.set(timer), time.perf_counter()
+
+    @staticmethod
+    def finish(request, response, timer, start):
+        wall = (time.perf_counter() - start) * 1000
+        db = timer.duration * 1000
+        template = request._template_timing[0]
+        match = getattr(request, 'resolver_match', None)
+        registry.record(match.view_name if match else 'unresolved', {
+            'wall_ms': wall,
+            'db_ms': db,
+            'template_ms': template,
+            'queries': len(timer.statements),
+            'duplicate_queries': len(timer.statements) - len(set(timer.statements)),
+            'response_bytes': 0 if response.streaming else len(response.content),
+        })
+        if show_server_timing(request):
+            response['Server-Timing'] = (f'app;dur={wall:.1f}, db;dur={db:.1f};desc="{len(timer.statements)} queries", '
+                                         f'tpl;dur={template:.1f}')
+        return response
+
+    def process_template_response(self, request, response):
+        """Start template timer, the post render callback stops it"""
+        timing = request._template_timing
+        timing[1] = time.perf_counter()
+
+        def stop(rendered):
+            timing[0] += (time.perf_counter() - timing[1]) * 1000
+
+        response.add_post_render_callback(stop)
+        return response
+
+
+@staff_member_required
+def metrics_json(request):
+    """Per-view percentiles for staff"""
+    return JsonResponse(registry.snapshot())
+
+
+@staff_member_required
+def metrics_prometheus(request):
+    """Per-view histograms in Prometheus text format for staff"""
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
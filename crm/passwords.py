@@ -0,0 +1,176 @@
+"""
+Password hashing and login throttling.
+
+PASSWORD_HASHER picks the hasher new passwords get, hashes of the other
+hashers are still accepted and upgraded on the next login. Hashing runs in
+a pool of PASSWORD_HASHING_THREADS threads: the hash functions release the
+GIL, so a login spike uses at most that many cores of a worker and other
+requests keep running. LoginForm refuses attempts of a username or an IP
+address over their limit of failures without checking the password.
+Failures are counted in the cache: with a per-process cache every worker
+would allow the full limit, which is one reason several workers need a
+shared cache backend.
+"""
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers, views as auth_views
+from django.contrib.auth.forms import AuthenticationForm
+from django.core.cache import cache
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.utils.crypto import constant_time_compare
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_THREADS,
+                                       thread_name_prefix='crm-hashing', initializer=_mark_pool_thread)
+        return _pool
+
+
+def _mark_pool_thread():
+    _local.in_pool = True
+
+
+def run_hashing(func, *args):
+    """Run func in the hashing pool and wait for it, calls made inside the pool run directly"""
+    if not settings.PASSWORD_HASHING_THREADS or getattr(_local, 'in_pool', False):
+        return func(*args)
+    return get_pool().submit(func, *args).result()
+
+
+class PooledHasherMixin:
+    """Hash and verify passwords in the hashing pool"""
+
+    def encode(self, *args):
+        return run_hashing(super().encode, *args)
+
+    def verify(self, password, encoded):
+        return run_hashing(super().verify, password, encoded)
+
+
+class PBKDF2PasswordHasher(PooledHasherMixin, hashers.PBKDF2PasswordHasher):
+    pass
+
+
+class Argon2PasswordHasher(PooledHasherMixin, hashers.Argon2PasswordHasher):
+    """Argon2id with ARGON2_PARAMS"""
+    time_cost = settings.ARGON2_PARAMS['time_cost']
+    memory_cost = settings.ARGON2_PARAMS['memory_cost']
+    parallelism = settings.ARGON2_PARAMS['parallelism']
+
+
+class ScryptPasswordHasher(hashers.BasePasswordHasher):
+    """scrypt from the standard library with SCRYPT_PARAMS, hashes are compatible with the hasher of Django 4.0"""
+    algorithm = 'scrypt'
+    work_factor = settings.SCRYPT_PARAMS['work_factor']
+    block_size = settings.SCRYPT_PARAMS['block_size']
+    parallelism = settings.SCRYPT_PARAMS['parallelism']
+    maxmem = 0
+
+    def encode(self, password, salt, work_factor=None, block_size=None, parallelism=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        work_factor = work_factor or self.work_factor
+        block_size = block_size or self.block_size
+        parallelism = parallelism or self.parallelism
+        return run_hashing(self._encode, password, salt, work_factor, block_size, parallelism)
+
+    def _encode(self, password, salt, work_factor, block_size, parallelism):
+        hash_ = hashlib.scrypt(password.encode(), salt=salt.encode(), n=work_factor, r=block_size, p=parallelism,
+                               maxmem=self.maxmem, dklen=64)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return f'{self.algorithm}${work_factor}${salt}${block_size}${parallelism}${hash_}'
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash_ = encoded.split('$', 6)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(password, decoded['salt'], decoded['work_factor'], decoded['block_size'],
+                                decoded['parallelism'])
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            'algorithm': decoded['algorithm'],
+            'work factor': decoded['work_factor'],
+            'block size': decoded['block_size'],
+            'parallelism': decoded['parallelism'],
+            'salt': hashers.mask_hash(decoded['salt']),
+            'hash': hashers.mask_hash(decoded['hash']),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return ((decoded['work_factor'], decoded['block_size'], decoded['parallelism'])
+                != (self.work_factor, self.block_size, self.parallelism))
+
+    def harden_runtime(self, password, encoded):
+        pass
+
+
+def get_client_ip(request):
+    """Get the address of the client, the last LOGIN_TRUSTED_PROXIES hops of X-Forwarded-For are proxies"""
+    if settings.LOGIN_TRUSTED_PROXIES:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= settings.LOGIN_TRUSTED_PROXIES:
+            return forwarded[-settings.LOGIN_TRUSTED_PROXIES]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LoginForm(AuthenticationForm):
+    """Authentication form limiting failed attempts per username and per IP address within LOGIN_ATTEMPTS_WINDOW"""
+
+    def get_attempt_limits(self):
+        username = (self.cleaned_data.get('username') or '').lower()
+        return {
+            f'login_failures:user:{hashlib.md5(username.encode()).hexdigest()}': settings.LOGIN_ATTEMPTS_PER_USER,
+            f'login_failures:ip:{get_client_ip(self.request)}': settings.LOGIN_ATTEMPTS_PER_IP,
+        }
+
+    def clean(self):
+        limits = self.get_attempt_limits()
+        failures = cache.get_many(limits)
+        if any(failures.get(key, 0) >= limit for key, limit in limits.items()):
+            raise ValidationError('Слишком много неудачных попыток входа, попробуйте позже', code='throttled')
+        try:
+            cleaned_data = super().clean()
+        except ValidationError as error:
+            if error.code == 'invalid_login':
+                for key in limits:
+                    if not cache.add(key, 1, settings.LOGIN_ATTEMPTS_WINDOW):
+                        try:
+                            cache.incr(key)
+                        except ValueError:
+                            cache.set(key, 1, settings.LOGIN_ATTEMPTS_WINDOW)
+            raise
+        cache.delete(next(iter(limits)))
+        return cleaned_data
+
+
+class LoginView(auth_views.LoginView):
+    form_class = LoginForm
+
+    def form_invalid(self, form):
+        throttled = form.has_error(NON_FIELD_ERRORS, 'throttled')
+        return self.render_to_response(self.get_context_data(form=form, throttled=throttled),
+                                       status=429 if throttled else 200)
@@ -0,0 +1,73 @@
+"""
+Authentication and authorization without repeated queries.
+
+PermissionRequiredMixin fetches the object of a detail view once per request,
+together with its owner when the view is limited to the owner, so the
+permission check and the view share one query. CachedModelBackend keeps the
+permission sets of users in the cache between requests. The PERMISSIONS
+namespace version is part of the key and is bumped when groups, permissions
+or their assignments change (management/signals.py). The user of a
+session is cached for USER_CACHE_TIMEOUT seconds and forgotten whenever the
+user row changes.
+"""
+from django.conf import settings
+from django.contrib.auth import mixins
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from company.cache import PERMISSIONS, get_versions
+
+
+class PermissionRequiredMixin(mixins.PermissionRequiredMixin):
+    """Permission check sharing the object with the view, object_owner_field limits access to the object's owner"""
+    object_owner_field = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset.select_related(self.object_owner_field) if self.object_owner_field else queryset
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def has_permission(self):
+        if not super().has_permission():
+            return False
+        if not self.object_owner_field:
+            return True
+        return getattr(self.get_object(), f'{self.object_owner_field}_id') == self.request.user.pk
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop the cached user, needed after changes that bypass post_save such as QuerySet.update()"""
+    cache.delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend keeping users and their permission sets in the cache between requests"""
+
+    def get_user(self, user_id):
+        if not settings.USER_CACHE_TIMEOUT:
+            return super().get_user(user_id)
+        user = cache.get(user_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(user_key(user_id), user, settings.USER_CACHE_TIMEOUT)
+        return user
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if user_obj.is_active and not user_obj.is_anonymous and obj is None and not hasattr(user_obj, '_perm_cache'):
+            key = f'permissions:{user_obj.pk}:{user_obj.is_superuser:d}:{get_versions(PERMISSIONS)}'
+            perms = cache.get(key)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, perms, settings.PERMISSION_CACHE_TIMEOUT)
+            user_obj._perm_cache = perms
+        return super().get_all_permissions(user_obj, obj)
@@ -48,8 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'crm.metrics.PerformanceMetricsMiddleware',
+    'crm.database.database_middleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'crm.asynchronous.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,6 +60,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request timings, see crm/metrics.py
+PERFORMANCE_METRICS = os.environ.get('PERFORMANCE_METRICS', 'on') != 'off'
+PERFORMANCE_METRICS_WINDOW = 1000
+# Server-Timing header on every response, otherwise only with DEBUG or for staff
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'off') == 'on'
+
+# Async interaction views, on by default under crm.asgi, see crm/asynchronous.py
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'off') == 'on'
+ASYNC_DB_THREADS = int(os.environ.get('ASYNC_DB_THREADS', 8))
+
 ROOT_URLCONF = 'crm.urls'
 
 TEMPLATES = [
@@ -90,6 +102,83 @@ DATABASES = {
 }
 
 
+# Cache
+# CACHE_BACKEND is one of redis, memcached, database, file or locmem, the default
+# is redis at REDIS_URL when it is set and locmem otherwise.
+# Cached pages, API ETags, permissions and login counters are invalidated by
+# bumping version keys (company/cache.py), which only reaches processes sharing
+# the cache: with more than one worker the backend must be shared, gunicorn
+# starts a single worker with locmem. The database backend costs a
+# query per cache access and needs `manage.py createcachetable`.
+
+CACHE_BACKENDS = {
+    'database': ('django.core.cache.backends.db.DatabaseCache', 'crm_cache'),
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'crm'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+    'redis': ('django_redis.cache.RedisCache', os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1')),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'locmem')
+cache_backend, cache_location = CACHE_BACKENDS[CACHE_BACKEND]
+CACHES = {
+    'default': {
+        'BACKEND': cache_backend,
+        'LOCATION': os.environ.get('CACHE_LOCATION', cache_location),
+    }
+}
+PAGE_CACHE_TIMEOUT = 300
+FRAGMENT_CACHE_TIMEOUT = 600
+FACET_CACHE_TIMEOUT = 300
+# Seconds permission sets are cached, bounds how long a revoked permission works if an invalidation is missed
+PERMISSION_CACHE_TIMEOUT = int(os.environ.get('PERMISSION_CACHE_TIMEOUT', 60))
+# Seconds the user of a session is cached, 0 loads it from the database on every request
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 60))
+
+# Sessions
+# SESSION_BACKEND is one of db, cached_db (cache with database write-through) or signed_cookies (no server state)
+
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_BACKENDS[os.environ.get('SESSION_BACKEND', 'cached_db')]
+
+AUTHENTICATION_BACKENDS = ['crm.permissions.CachedModelBackend']
+
+# Password hashing
+# PASSWORD_HASHER is one of argon2, scrypt or pbkdf2, hashes of the others are upgraded on login
+
+PASSWORD_HASHERS_AVAILABLE = {
+    'argon2': 'crm.passwords.Argon2PasswordHasher',
+    'scrypt': 'crm.passwords.ScryptPasswordHasher',
+    'pbkdf2': 'crm.passwords.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+PASSWORD_HASHERS = [PASSWORD_HASHERS_AVAILABLE[PASSWORD_HASHER], *(
+    hasher for name, hasher in PASSWORD_HASHERS_AVAILABLE.items() if name != PASSWORD_HASHER
+)]
+ARGON2_PARAMS = {
+    'time_cost': int(os.environ.get('ARGON2_TIME_COST', 2)),
+    'memory_cost': int(os.environ.get('ARGON2_MEMORY_COST', 19456)),  # KiB
+    'parallelism': int(os.environ.get('ARGON2_PARALLELISM', 1)),
+}
+SCRYPT_PARAMS = {
+    'work_factor': int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 14)),
+    'block_size': int(os.environ.get('SCRYPT_BLOCK_SIZE', 8)),
+    'parallelism': int(os.environ.get('SCRYPT_PARALLELISM', 1)),
+}
+# Threads of a worker that hash passwords, 0 hashes in the request thread
+PASSWORD_HASHING_THREADS = int(os.environ.get('PASSWORD_HASHING_THREADS', 2))
+
+# Login throttling: failed attempts allowed per username and per IP address within the window in seconds.
+# Failures are counted in the cache, so the limits hold across workers only with a shared cache backend.
+LOGIN_ATTEMPTS_PER_USER = int(os.environ.get('LOGIN_ATTEMPTS_PER_USER', 5))
+LOGIN_ATTEMPTS_PER_IP = int(os.environ.get('LOGIN_ATTEMPTS_PER_IP', 20))
+LOGIN_ATTEMPTS_WINDOW = int(os.environ.get('LOGIN_ATTEMPTS_WINDOW', 900))
+# Reverse proxies appending to X-Forwarded-For in front of the app, 0 uses REMOTE_ADDR
+LOGIN_TRUSTED_PROXIES = int(os.environ.get('LOGIN_TRUSTED_PROXIES', 0))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -140,9 +229,25 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'archives')
 FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
 FILE_UPLOAD_PERMISSION = 0o700
-CKEDITOR_UPLOAD_PATH = os.path.join(BASE_DIR, 'archives')
+CKEDITOR_UPLOAD_PATH = 'uploads/'
+# Limits and output of uploaded manager photos and CKEditor images, see crm/media.py
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.environ.get('UPLOAD_MAX_PIXELS', 50 * 1000 * 1000))
+UPLOAD_MAX_DIMENSION = 2048
+UPLOAD_IMAGE_FORMATS = ['AVIF', 'WEBP', 'JPEG']
+UPLOAD_IMAGE_QUALITY = 80
+# Media transfer: '' in process, 'nginx' with X-Accel-Redirect to MEDIA_ACCEL_PREFIX, 'apache' with X-Sendfile
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = '/internal-media/'
+# Browser cache time of media files that can change, content addressed files are immutable
+MEDIA_MAX_AGE = 3600
+# Manager photo thumbnails as name: sorl geometry, generated in the background, see management/thumbnails.py
+PHOTO_THUMBNAILS = {'detail': '150'}
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
 DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STATICFILES_STORAGE = 'crm.assets.BundleStaticFilesStorage'
+# Templates link hashed bundles built by collectstatic, in development their sources, see crm/assets.py
+ASSET_BUNDLES = os.environ.get('ASSET_BUNDLES', 'off' if DEBUG else 'on') == 'on'
 
 import dj_database_url
 db_from_env = dj_database_url.config(conn_max_age=500)
@@ -150,3 +255,35 @@ DATABASES['default'].update(db_from_env)
 
 import django_heroku
 django_heroku.settings(locals())
+# django_heroku sets the plain WhiteNoise storage
+STATICFILES_STORAGE = 'crm.assets.BundleStaticFilesStorage'
+# django_heroku puts the sync-only WhiteNoise in front, the async capable one is already in the list
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware != 'whitenoise.middleware.WhiteNoiseMiddleware']
+
+
+# Replica and connection pooling, see crm/database.py
+# DATABASE_REPLICA_URL adds a read-only alias, locally it can be a second SQLite
+# file refreshed with manage.py sync_sqlite_replica.
+# DATABASE_POOL is "persistent" (every worker thread keeps its connection for
+# DATABASE_CONN_MAX_AGE seconds) or "pgbouncer" (transaction pooling, server-side
+# cursors are off because a cursor cannot outlive a pgbouncer transaction, so
+# exports read one keyset query per chunk instead, see company/export.py).
+# Reused PostgreSQL connections are checked before their first query of a request.
+# gunicorn.conf.py bounds workers by DATABASE_MAX_CONNECTIONS.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL,
+                                                 conn_max_age=DATABASES['default'].get('CONN_MAX_AGE', 0))
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['crm.database.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'persistent')
+for database in DATABASES.values():
+    if 'DATABASE_CONN_MAX_AGE' in os.environ:
+        database['CONN_MAX_AGE'] = int(os.environ['DATABASE_CONN_MAX_AGE'])
+    database['CONN_HEALTH_CHECKS'] = bool(database.get('CONN_MAX_AGE')) and os.environ.get('DATABASE_HEALTH_CHECKS') != 'off'
+    if database['CONN_HEALTH_CHECKS'] and database['ENGINE'].endswith(('.postgresql', '.postgresql_psycopg2')):
+        database['ENGINE'] = 'crm.backends.postgresql'
+    if DATABASE_POOL == 'pgbouncer':
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
@@ -13,12 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import include
-from django.urls import path
+from django.urls import path, re_path
 from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
+from . import media, metrics, passwords
 urlpatterns = [
     path('admin/', admin.site.urls),
 ]
@@ -26,6 +29,7 @@ urlpatterns += [
     path('management/', include('management.urls')),
     ]
 urlpatterns += [
+    path('ckeditor/upload/', staff_member_required(media.upload)),
     path('ckeditor/', include('ckeditor_uploader.urls')),
     ]
 urlpatterns += [
@@ -35,7 +39,18 @@ urlpatterns += [
     path('', RedirectView.as_view(url='/company/', permanent=True)),
     ]
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 urlpatterns += [
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', media.serve, name='media'),
+]
+urlpatterns += [
+    path('accounts/login/', passwords.LoginView.as_view(), name='login'),
     path('accounts/', include('django.contrib.auth.urls')),
+]
+urlpatterns += [
+    path('api/v1/', include('company.api')),
+    path('api/v1/', include('management.api')),
+]
+urlpatterns += [
+    path('metrics/', metrics.metrics_json, name='metrics'),
+    path('metrics/prometheus', metrics.metrics_prometheus, name='metrics_prometheus'),
 ]
\ No newline at end of file
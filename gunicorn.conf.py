@@ -0,0 +1,26 @@
+"""
+Gunicorn settings keeping database connections of all workers under
+DATABASE_MAX_CONNECTIONS.
+
+Workers share invalidation of cached data through the cache, so with the
+per-process locmem cache (no REDIS_URL or CACHE_BACKEND) a single worker is
+started and a warning logged.
+
+A sync worker thread keeps one connection per database alias, an ASGI
+worker one per thread of its database pool (ASYNC_DB_THREADS), so the
+asgi process sets DATABASE_CONNECTIONS_PER_WORKER to that pool size.
+"""
+import os
+import sys
+
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+aliases = 2 if os.environ.get('DATABASE_REPLICA_URL') else 1
+connections_per_worker = int(os.environ.get('DATABASE_CONNECTIONS_PER_WORKER', threads)) * aliases
+max_connections = int(os.environ.get('DATABASE_MAX_CONNECTIONS', 20))
+workers = max(1, min(int(os.environ.get('WEB_CONCURRENCY', 2)), max_connections // connections_per_worker))
+
+cache_backend = os.environ.get('CACHE_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'locmem')
+if workers > 1 and cache_backend == 'locmem':
+    print(f'WARNING: the locmem cache is private to each worker, starting 1 worker instead of {workers}: '
+          'set REDIS_URL or CACHE_BACKEND to a shared backend to run more', file=sys.stderr)
+    workers = 1
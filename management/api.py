@@ -0,0 +1,74 @@
+from django.urls import path
+from company.cache import COMPANIES, INTERACTIONS, KEYWORDS, PROJECTS, USERS
+from crm.api import ApiDetailView, ApiListView, Field
+from .models import Interaction, Keyword, User
+from .views import KeywordsChannel
+
+
+class InteractionResource:
+    """Fields of an interaction in API responses"""
+    model = Interaction
+    ordering = '-pk'
+    permission_required = 'management.view_interaction'
+    cache_namespaces = (INTERACTIONS, COMPANIES, PROJECTS, USERS)
+    last_modified_field = 'date_create'
+    fields = {
+        'id': Field('id'),
+        'date_create': Field('date_create'),
+        'company': Field('company_id'),
+        'company_name': Field('company.name'),
+        'project': Field('project_id'),
+        'project_name': Field('project.project'),
+        'channel': Field('channel'),
+        'manager': Field('manager_id'),
+        'manager_username': Field('manager.username'),
+        'grade': Field('grade'),
+        'description': Field('description'),
+    }
+
+
+class InteractionApiList(InteractionResource, ApiListView, KeywordsChannel):
+    """Interactions filtered by q keywords, channels and facets like the interaction list"""
+
+    def get_queryset(self):
+        return self.filter_by_facets(self.filter_by_keywords(super().get_queryset()))
+
+
+class InteractionApiDetail(InteractionResource, ApiDetailView):
+    """Interaction if user can view interactions"""
+
+
+class KeywordApiList(ApiListView):
+    """Keywords of the interactions' filter"""
+    model = Keyword
+    ordering = 'pk'
+    permission_required = 'management.view_interaction'
+    cache_namespaces = (KEYWORDS,)
+    fields = {'id': Field('id'), 'keyword': Field('keyword')}
+
+
+class ManagerApiDetail(ApiDetailView):
+    """Profile of current user"""
+    model = User
+    permission_required = 'management.view_user'
+    cache_namespaces = (USERS,)
+    fields = {
+        'id': Field('id'),
+        'username': Field('username'),
+        'first_name': Field('first_name'),
+        'last_name': Field('last_name'),
+        'email': Field('email'),
+        'bio': Field('bio'),
+        'photo': Field('photo', format=lambda photo: photo.url if photo else None),
+    }
+
+    def get_object(self, queryset=None):
+        return self.get_queryset().get(pk=self.request.user.pk)
+
+
+urlpatterns = [
+    path('interactions/', InteractionApiList.as_view(), name='api_interaction_list'),
+    path('interactions/<int:pk>/', InteractionApiDetail.as_view(), name='api_interaction_detail'),
+    path('keywords/', KeywordApiList.as_view(), name='api_keyword_list'),
+    path('manager/', ManagerApiDetail.as_view(), name='api_manager_detail'),
+]
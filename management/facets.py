@@ -0,0 +1,160 @@
+"""
+Faceted filtering of interactions.
+
+Values checked within a facet are alternatives, facets are combined with
+AND. The count next to a value is the number of interactions the list would
+show with that value checked and the other facets unchanged, so counts of a
+facet do not depend on its own selection.
+
+All counts come from one grouped query over the interactions left by the q
+search: one row per combination of channel, grade, company, project and
+manager with the number of interactions, the number having a checked
+keyword and the number having each keyword. Facet selections are applied
+to these rows in Python, so the rows are cached per search and checked
+keywords and reused while other facets are toggled, until one of the
+namespaces they depend on changes. Cached counts may lag behind writes made
+without signals or seen by another cache, so they are shown but never used
+to cut the page, the total is reused only right after the query ran.
+
+The rows grow with distinct combinations of the five columns: on large
+tables with many projects and managers that approaches one row per
+interaction, then the facet query costs about as much as reading the table.
+"""
+import hashlib
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db.models import Count, Q
+from company.cache import COMPANIES, INTERACTIONS, KEYWORDS, PROJECTS, USERS, get_versions
+from .models import Interaction, Keyword, KeywordMatch
+
+KEYWORD = 'keyword'
+
+
+class Facet:
+    """Column of interactions filtered by request parameter name, label_fields name values for people"""
+
+    def __init__(self, name, verbose_name, field, label_fields=(), label_format='{}', choices=None):
+        self.name = name
+        self.verbose_name = verbose_name
+        self.field = field
+        self.label_fields = label_fields
+        self.label_format = label_format
+        self.choices = choices or []
+
+    def get_label(self, group):
+        return self.label_format.format(*(group[field] for field in self.label_fields))
+
+    def to_python(self, value):
+        """Get a value of the column from a request parameter, None if it is not one"""
+        try:
+            return Interaction._meta.get_field(self.field).to_python(value)
+        except ValidationError:
+            return None
+
+    def filter(self, qs, values):
+        return qs.filter(**{f'{self.field}__in': values})
+
+
+FACETS = (
+    Facet('channel', 'Канал', 'channel', choices=[channel for channel, _ in Interaction.CHANNEL]),
+    Facet('grade', 'Оценка', 'grade', choices=[grade for grade, _ in Interaction.GRADE]),
+    Facet('company', 'Компания', 'company_id', ('company__name',)),
+    # names of projects repeat across companies
+    Facet('project', 'Проект', 'project_id', ('project__project', 'company__name'), '{} ({})'),
+    Facet('manager', 'Менеджер', 'manager_id', ('manager__username',)),
+)
+
+
+def get_selection(params, facets):
+    """Get checked values of facets and keyword ids from request parameters, unknown values are dropped"""
+    selection = {}
+    for facet in facets:
+        values = {facet.to_python(value) for value in params.getlist(facet.name)} - {None}
+        if values:
+            selection[facet.name] = values
+    keywords = {int(value) for value in params.getlist(KEYWORD) if value.isdigit()}
+    if keywords:
+        selection[KEYWORD] = keywords
+    return selection
+
+
+def filter_interactions(qs, facets, selection):
+    """Limit interactions to checked values of every facet"""
+    for facet in facets:
+        if facet.name in selection:
+            qs = facet.filter(qs, selection[facet.name])
+    if KEYWORD in selection:
+        qs = qs.filter(pk__in=KeywordMatch.objects.filter(keyword_id__in=selection[KEYWORD]).values('interaction_id'))
+    return qs
+
+
+def get_groups(qs, facets, keyword_ids):
+    """Get keywords, interaction counts grouped by facet columns and whether they were just queried
+
+    Groups are cached until data changes.
+    """
+    try:
+        sql = str(qs.query)
+    except EmptyResultSet:
+        return [], [], True
+    raw = f'{sql}:{[facet.name for facet in facets]}:{sorted(keyword_ids)}'
+    versions = get_versions(INTERACTIONS, KEYWORDS, COMPANIES, PROJECTS, USERS)
+    key = f'facets:{hashlib.md5(raw.encode()).hexdigest()}:{versions}'
+    cached = cache.get(key)
+    if cached is not None:
+        return (*cached, False)
+    keywords = list(Keyword.objects.order_by('keyword').values_list('id', 'keyword'))
+    annotations = {'total': Count('id', distinct=True)}
+    if keyword_ids:
+        annotations['checked'] = Count('id', distinct=True, filter=Q(keyword_matches__keyword_id__in=keyword_ids))
+    for keyword_id, _ in keywords:
+        # a keyword matches an interaction once, so counting matches counts interactions
+        annotations[f'keyword_{keyword_id}'] = Count('keyword_matches',
+                                                     filter=Q(keyword_matches__keyword_id=keyword_id))
+    columns = dict.fromkeys(column for facet in facets for column in (facet.field, *facet.label_fields))
+    groups = list(qs.order_by().values(*columns).annotate(**annotations))
+    cache.set(key, (keywords, groups), settings.FACET_CACHE_TIMEOUT)
+    return keywords, groups, True
+
+
+def count_facets(qs, facets, selection):
+    """Get facets with their values and counts for templates and the number of interactions selected
+
+    The number is None when counts come from the cache.
+    """
+    keywords, groups, fresh = get_groups(qs, facets, selection.get(KEYWORD, set()))
+    counts = {facet.name: Counter() for facet in facets}
+    counts[KEYWORD] = Counter()
+    labels = {facet.name: {value: value for value in facet.choices} for facet in facets}
+    labels[KEYWORD] = dict(keywords)
+    total = 0
+    for group in groups:
+        matched = group['checked'] if KEYWORD in selection else group['total']
+        excluded = [facet for facet in facets
+                    if facet.name in selection and group[facet.field] not in selection[facet.name]]
+        for facet in facets:
+            value = group[facet.field]
+            if value is not None and facet.label_fields:
+                labels[facet.name].setdefault(value, facet.get_label(group))
+            if not excluded or excluded == [facet]:
+                counts[facet.name][value] += matched
+        if not excluded:
+            total += matched
+            for keyword_id, _ in keywords:
+                counts[KEYWORD][keyword_id] += group[f'keyword_{keyword_id}']
+    sections = [(facet.name, facet.verbose_name, bool(facet.label_fields)) for facet in facets]
+    sections.append((KEYWORD, 'Ключевое слово', False))
+    result = []
+    for name, verbose_name, by_label in sections:
+        values = labels[name].items()
+        if by_label:
+            values = sorted(values, key=lambda item: str(item[1]))
+        result.append({
+            'name': name,
+            'verbose_name': verbose_name,
+            'values': [{'value': value, 'label': label, 'count': counts[name][value],
+                        'checked': value in selection.get(name, ())} for value, label in values],
+        })
+    return result, total if fresh else None
@@ -1,4 +1,6 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from crm.media import process_image
 from .models import User
 
 
@@ -6,3 +8,10 @@ class UserForm(forms.ModelForm):
     class Meta:
         model = User
         fields = ['username', 'first_name', 'last_name', 'email', 'password', 'bio', 'photo']
+
+    def clean_photo(self):
+        """Replace a new upload with its processed content addressed copy"""
+        photo = self.cleaned_data.get('photo')
+        if isinstance(photo, UploadedFile):
+            photo = process_image(photo)
+        return photo
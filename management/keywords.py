@@ -0,0 +1,54 @@
+import re
+from .models import Interaction, Keyword, KeywordMatch
+from .search import search_interactions
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase text and reduce it to space separated tokens"""
+    return ' '.join(TOKEN_RE.findall((text or '').lower()))
+
+
+def is_match(keyword, channel, description):
+    """Check if all tokens of keyword appear in a row in channel or description"""
+    needle = f' {normalize(keyword)} '
+    return needle.strip() != '' and any(needle in f' {normalize(text)} ' for text in (channel, description))
+
+
+def build_matches(rows, keywords):
+    """Get KeywordMatch objects for (pk, channel, description) rows and (pk, keyword) pairs"""
+    return [KeywordMatch(keyword_id=keyword_pk, interaction_id=pk)
+            for pk, channel, description in rows
+            for keyword_pk, keyword in keywords
+            if is_match(keyword, channel, description)]
+
+
+def match_interaction(interaction):
+    """Replace stored matches of one interaction"""
+    KeywordMatch.objects.filter(interaction=interaction).delete()
+    rows = [(interaction.pk, interaction.channel, interaction.description)]
+    KeywordMatch.objects.bulk_create(build_matches(rows, Keyword.objects.values_list('pk', 'keyword')))
+
+
+def match_keyword(keyword, batch_size=1000):
+    """Replace stored matches of one keyword, search index narrows the candidates"""
+    KeywordMatch.objects.filter(keyword=keyword).delete()
+    candidates = search_interactions(Interaction.objects.all(), [keyword.keyword]).order_by()
+    rows = candidates.values_list('pk', 'channel', 'description').iterator(chunk_size=batch_size)
+    KeywordMatch.objects.bulk_create(build_matches(rows, [(keyword.pk, keyword.keyword)]), batch_size=batch_size)
+
+
+def backfill(chunk_size=1000):
+    """Match all keywords against all interactions walking the table in pk chunks"""
+    keywords = list(Keyword.objects.values_list('pk', 'keyword'))
+    last_pk, created = 0, 0
+    while True:
+        rows = list(Interaction.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'channel', 'description')[:chunk_size])
+        if not rows:
+            return created
+        matches = build_matches(rows, keywords)
+        KeywordMatch.objects.bulk_create(matches, ignore_conflicts=True)
+        created += len(matches)
+        last_pk = rows[-1][0]
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from management.keywords import backfill
+
+
+class Command(BaseCommand):
+    help = 'Match all keywords against existing interactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Interactions processed per batch')
+
+    def handle(self, *args, **options):
+        created = backfill(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Keyword matches found: {created}'))
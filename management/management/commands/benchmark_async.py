@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from .benchmark_views import benchmark_interaction
+
+MODES = ('sync', 'async')
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput of concurrent requests to a view served by sync and async views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url-name', default='interaction_list', help='Named URL without arguments')
+        parser.add_argument('--query', default='', help='Query string, e.g. "q=contract"')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight')
+        parser.add_argument('--output', help='Path of JSON report')
+        parser.add_argument('--mode', choices=MODES, help='Measure one mode in this process')
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+        results = {mode: self.run_child(mode, options) for mode in MODES}
+        for mode, result in results.items():
+            self.stdout.write(f"{mode}: {result['rps']} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                              f"errors {result['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"async/sync throughput: {results['async']['rps'] / results['sync']['rps']:.2f}"))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'options': {key: options[key] for key in ('url_name', 'query', 'requests', 'concurrency')},
+                           'results': results}, file, indent=2)
+
+    @staticmethod
+    def run_child(mode, options):
+        """Measure a mode in a new process, URLconf picks view classes by ASYNC_VIEWS once at import"""
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_async', '--mode', mode,
+                   '--url-name', options['url_name'], '--query', options['query'],
+                   '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])]
+        env = dict(os.environ, ASYNC_VIEWS='on' if mode == 'async' else 'off', PERFORMANCE_METRICS='off')
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'{mode} run failed:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def measure(self, options):
+        url = reverse(options['url_name'])
+        if options['query']:
+            url = f"{url}?{options['query']}"
+        client = Client()
+        with benchmark_interaction() as interaction, \
+                override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            client.force_login(interaction.manager)
+            client.get(url, secure=True)
+            run = self.run_async if options['mode'] == 'async' else self.run_sync
+            start = time.perf_counter()
+            timings, errors = run(client, url, options['requests'], options['concurrency'])
+            total = time.perf_counter() - start
+        timings.sort()
+
+        def percentile(value):
+            return round(timings[min(len(timings) - 1, int(len(timings) * value))], 2)
+
+        return {
+            'url': url,
+            'rps': round(len(timings) / total, 1),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'errors': errors,
+        }
+
+    @staticmethod
+    def run_sync(client, url, requests, concurrency):
+        """Thread per in-flight request, like threaded WSGI workers"""
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.cookies = client.cookies
+            start = time.perf_counter()
+            response = local.client.get(url, secure=True)
+            return (time.perf_counter() - start) * 1000, response.status_code
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, range(requests)))
+        return [timing for timing, _ in results], sum(status != 200 for _, status in results)
+
+    @staticmethod
+    def run_async(client, url, requests, concurrency):
+        """One event loop with a bounded number of in-flight requests"""
+
+        async def main():
+            async_client = AsyncClient()
+            async_client.cookies = client.cookies
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fetch():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await async_client.get(url, secure=True)
+                    return (time.perf_counter() - start) * 1000, response.status_code
+
+            return await asyncio.gather(*(fetch() for _ in range(requests)))
+
+        results = asyncio.run(main())
+        return [timing for timing, _ in results], sum(status != 200 for _, status in results)
@@ -0,0 +1,70 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from company.models import Company
+from management import synthetic
+from management.models import Interaction
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic data and compare query plans and timings with and without composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1000)
+        parser.add_argument('--projects', type=int, default=5, help='Projects per company')
+        parser.add_argument('--interactions', type=int, default=100000)
+        parser.add_argument('--managers', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of every query')
+        parser.add_argument('--no-seed', action='store_true', help='Use data already in the database')
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.seed(options)
+        manager = Interaction.objects.exclude(manager=None).values_list('manager_id', flat=True).first()
+        interaction = Interaction.objects.values('company_id', 'project_id').first()
+        if interaction is None:
+            self.stderr.write('No interactions to benchmark')
+            return
+        queries = {
+            'company list by name': Company.objects.order_by('name', 'id')[:10],
+            'company list by -date_create': Company.objects.order_by('-date_create', '-id')[:10],
+            'interactions by -grade': Interaction.objects.order_by('-grade', '-id')[:10],
+            'interactions of manager by -grade': Interaction.objects.filter(manager_id=manager).order_by('-grade', '-id')[:10],
+            'interactions of company': Interaction.objects.filter(company_id=interaction['company_id']).order_by('-id')[:10],
+            'interactions of company and project': Interaction.objects.filter(**interaction)[:10],
+        }
+        self.report('with indexes', queries, options['repeat'])
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for model in (Company, Interaction):
+                    for index in model._meta.indexes:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+            self.report('without indexes', queries, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        """Insert synthetic data with bulk inserts"""
+        counts = synthetic.generate(companies=options['companies'], projects=options['projects'],
+                                    interactions=options['interactions'], users=options['managers'])
+        self.stdout.write('Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, qs in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(qs.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(f'{name}: median {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms')
+            for line in self.explain(qs, title):
+                self.stdout.write(f'    {line}')
+
+    @staticmethod
+    def explain(qs, title):
+        """Get query plan, comment with title keeps cached plans of the other run out"""
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql} /* {title} */', params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
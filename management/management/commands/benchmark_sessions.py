@@ -0,0 +1,94 @@
+import json
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from .benchmark_views import benchmark_interaction
+
+USER_CACHE_TIMEOUT = 60
+MODES = {
+    'db': {'SESSION_ENGINE': settings.SESSION_BACKENDS['db'], 'USER_CACHE_TIMEOUT': 0},
+    'cached_db': {'SESSION_ENGINE': settings.SESSION_BACKENDS['cached_db'], 'USER_CACHE_TIMEOUT': 0},
+    'cached_db+user': {'SESSION_ENGINE': settings.SESSION_BACKENDS['cached_db'],
+                       'USER_CACHE_TIMEOUT': USER_CACHE_TIMEOUT},
+    'signed_cookies+user': {'SESSION_ENGINE': settings.SESSION_BACKENDS['signed_cookies'],
+                            'USER_CACHE_TIMEOUT': USER_CACHE_TIMEOUT},
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and latency of an authenticated page with each session storage and the user cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url-name', default='company_list', help='Named URL without arguments')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per mode')
+        parser.add_argument('--output', help='Path of JSON report')
+
+    def handle(self, *args, **options):
+        url = reverse(options['url_name'])
+        results = {}
+        with benchmark_interaction() as interaction:
+            for mode, mode_settings in MODES.items():
+                with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+                                       **mode_settings):
+                    results[mode] = self.measure(url, interaction.manager, options['iterations'])
+                self.stdout.write(f"{mode}: {results[mode]['queries']} queries, p50 {results[mode]['p50_ms']} ms, "
+                                  f"p95 {results[mode]['p95_ms']} ms")
+        saved = results['db']['queries'] - results['cached_db+user']['queries']
+        self.stdout.write(self.style.SUCCESS(f'Queries saved per request by cached_db and the user cache: {saved}'))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'url': url, 'iterations': options['iterations'], 'results': results}, file, indent=2)
+
+    @staticmethod
+    @contextmanager
+    def empty_cache():
+        """Switch the configured cache to a new key prefix instead of clearing it
+
+        Clearing a shared cache would drop the sessions and login counters of
+        real users. Keys of the prefix are deleted afterwards where the backend
+        can match them (redis), elsewhere they expire.
+        """
+        prefix = f'benchmark-{uuid.uuid4().hex[:8]}'
+        with override_settings(CACHES={alias: dict(config, KEY_PREFIX=prefix)
+                                       for alias, config in settings.CACHES.items()}):
+            try:
+                yield
+            finally:
+                if hasattr(cache, 'delete_pattern'):
+                    cache.delete_pattern('*')
+
+    def measure(self, url, user, iterations):
+        """Get query count and latency percentiles of requests after the first, which fills the caches"""
+        with self.empty_cache():
+            return self.measure_requests(url, user, iterations)
+
+    @staticmethod
+    def measure_requests(url, user, iterations):
+        client = Client()
+        client.force_login(user)
+        client.get(url, secure=True)
+        with CaptureQueriesContext(connection) as context:
+            client.get(url, secure=True)
+        # request_started resets the query log, read it before the timed requests
+        queries = [query['sql'] for query in context.captured_queries]
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            client.get(url, secure=True)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            'queries': len(queries),
+            'query_sql': queries,
+            'mean_ms': round(statistics.mean(timings), 3),
+            'p50_ms': round(timings[len(timings) // 2], 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        }
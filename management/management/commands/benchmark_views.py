@@ -0,0 +1,157 @@
+import datetime
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from django.contrib.auth.models import Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from company import urls as company_urls
+from company.models import Company, Project
+from management import urls as management_urls
+from management.models import Interaction, User
+
+
+@contextmanager
+def benchmark_interaction():
+    """Create a company, project and interaction owned by a user with model permissions, delete them on exit
+
+    The user is not a superuser and owns the interaction, so owner-only pages
+    are allowed without changing rows of real users.
+    """
+    if not Interaction.objects.exists():
+        raise CommandError('No interactions found, run generate_data first')
+    user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex[:8]}')
+    company = None
+    try:
+        user.user_permissions.set(Permission.objects.filter(content_type__app_label__in=['company', 'management']))
+        today = datetime.date.today()
+        company = Company.objects.create(name='Benchmark', address='Benchmark', description='Benchmark')
+        project = Project.objects.create(project='Benchmark', company=company, description='Benchmark',
+                                         start_date=today, final_date=today, price=0)
+        yield Interaction.objects.create(project=project, company=company, channel='Email', manager=user,
+                                         description='Benchmark', grade=3)
+    finally:
+        if company is not None:
+            company.delete()
+        user.delete()
+
+
+class Command(BaseCommand):
+    help = 'Request every company and management URL as a benchmark user and write latency, queries and memory to JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per URL')
+        parser.add_argument('--output', default='benchmark.json', help='Path of JSON report')
+        parser.add_argument('--compare', help='Previous JSON report to print differences against')
+
+    def handle(self, *args, **options):
+        with benchmark_interaction() as interaction:
+            results = self.measure_urls(interaction, options['iterations'])
+        report = {
+            'commit': self.get_commit(),
+            'date': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'rows': {'interactions': Interaction.objects.count(), 'projects': Project.objects.count()},
+            'urls': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def measure_urls(self, interaction, iterations):
+        """Measure every URL as the owner of interaction"""
+        client = Client()
+        client.force_login(interaction.manager)
+        results = {}
+        with override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            for name, url in self.get_urls(interaction):
+                results[name] = self.measure(client, url, iterations)
+                self.stdout.write(f"{name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms, "
+                                  f"{results[name]['queries']} queries, {results[name]['peak_memory_kb']} KB")
+        return results
+
+    @staticmethod
+    def get_urls(interaction):
+        """Build a URL for every named pattern of company and management apps"""
+        kwargs = {
+            'company': {'pk': interaction.company_id},
+            'project': {'pk': interaction.project_id},
+            'interaction': {'pk': interaction.pk},
+        }
+        for module in (company_urls, management_urls):
+            for pattern in module.urlpatterns:
+                if not isinstance(pattern, URLPattern) or not pattern.name:
+                    continue
+                params = {}
+                if pattern.pattern.converters:
+                    params = kwargs[pattern.callback.view_class.model._meta.model_name]
+                yield pattern.name, reverse(pattern.name, kwargs=params)
+
+    @staticmethod
+    def fetch(client, url):
+        """Request url and read the whole body, streaming responses run their queries while being read"""
+        response = client.get(url, secure=True)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def measure(self, client, url, iterations):
+        """Get latency percentiles, query count and peak traced memory of one URL"""
+        response, content = self.fetch(client, url)
+        with CaptureQueriesContext(connection) as context:
+            self.fetch(client, url)
+        queries = len(context.captured_queries)
+        tracemalloc.start()
+        self.fetch(client, url)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            self.fetch(client, url)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        def percentile(value):
+            return round(timings[min(len(timings) - 1, int(len(timings) * value))], 2)
+
+        return {
+            'url': url,
+            'status': response.status_code,
+            'size': len(content),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'queries': queries,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, path, results):
+        with open(path) as file:
+            previous = json.load(file)['urls']
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Compared with {path}'))
+        for name, current in results.items():
+            if name not in previous:
+                continue
+            old = previous[name]
+            self.stdout.write(f"{name}: p50 {old['p50_ms']} -> {current['p50_ms']} ms, "
+                              f"queries {old['queries']} -> {current['queries']}, "
+                              f"memory {old['peak_memory_kb']} -> {current['peak_memory_kb']} KB")
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            return None
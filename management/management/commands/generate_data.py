@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from management import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic companies, contacts, projects, users and interactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=100)
+        parser.add_argument('--contacts', type=int, default=2, help='Contact persons per company')
+        parser.add_argument('--phones', type=int, default=2, help='Phones per company')
+        parser.add_argument('--emails', type=int, default=2, help='Emails per company')
+        parser.add_argument('--projects', type=int, default=3, help='Projects per company')
+        parser.add_argument('--interactions', type=int, default=1000)
+        parser.add_argument('--keywords', type=int, default=10)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = synthetic.generate(companies=options['companies'], contacts=options['contacts'],
+                                        phones=options['phones'], emails=options['emails'],
+                                        projects=options['projects'], interactions=options['interactions'],
+                                        keywords_count=options['keywords'], users=options['users'],
+                                        batch_size=options['batch_size'])
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS('Synthetic data generated'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from management.stats import STATS_OWNERS, recompute
+
+
+class Command(BaseCommand):
+    help = 'Recompute company and project interaction statistics'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, owner_field in STATS_OWNERS:
+                count = recompute(model, owner_field)
+                self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+        self.stdout.write(self.style.SUCCESS('Statistics recomputed'))
@@ -0,0 +1,25 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the SQLite replica files to try replica routing locally'
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Set DATABASE_REPLICA_URL, e.g. sqlite:////tmp/replica.sqlite3')
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('Only SQLite files can be copied, real replicas are fed by database replication')
+            source = sqlite3.connect(primary.settings_dict['NAME'])
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f"{alias}: copied to {replica.settings_dict['NAME']}"))
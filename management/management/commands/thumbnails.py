@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from management import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Pre-generate manager photo thumbnails or delete unused photos and thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['warm', 'gc'], help='warm: generate missing thumbnails, gc: delete unused photos and thumbnails')
+        parser.add_argument('--force', action='store_true', help='Regenerate thumbnails that already exist')
+        parser.add_argument('--dry-run', action='store_true', help='List unused files without deleting them')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'warm':
+            count = thumbnails.warm(force=options['force'])
+            self.stdout.write(self.style.SUCCESS(f'Photos processed: {count}'))
+            return
+        deleted = thumbnails.collect_garbage(dry_run=options['dry_run'])
+        for name in deleted:
+            self.stdout.write(name)
+        verb = 'Unused' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} files: {len(deleted)}'))
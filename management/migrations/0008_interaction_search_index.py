@@ -0,0 +1,38 @@
+from django.db import migrations
+
+FTS_TABLE = 'management_interaction_fts'
+GIN_INDEX = 'interaction_search_gin'
+
+
+def create_search_index(apps, schema_editor):
+    """Create GIN index on PostgreSQL or FTS5 table on SQLite"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+        Interaction = apps.get_model('management', 'Interaction')
+        index = GinIndex(SearchVector('channel', 'description', config='simple'), name=GIN_INDEX)
+        schema_editor.add_index(Interaction, index)
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(channel, description)')
+        schema_editor.execute(f'INSERT INTO {FTS_TABLE} (rowid, channel, description) '
+                              f'SELECT id, channel, description FROM management_interaction')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0007_auto_20210818_1153'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0008_interaction_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeywordMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_matches', to='management.interaction', verbose_name='Взаимодействие')),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='management.keyword', verbose_name='Ключевое слово')),
+            ],
+            options={
+                'verbose_name': 'Совпадение ключевого слова',
+                'verbose_name_plural': 'Совпадения ключевых слов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='keywordmatch',
+            constraint=models.UniqueConstraint(fields=('keyword', 'interaction'), name='unique_keyword_match'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:43
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+import django.db.models.deletion
+
+CHANNEL_FIELDS = {'Звонок': 'calls', 'Письмо': 'letters', 'Email': 'emails', 'Сайт': 'sites'}
+
+
+def backfill_stats(apps, schema_editor):
+    """Count interactions created before statistics existed"""
+    interaction = apps.get_model('management', 'Interaction')
+    channel_counts = {field: Count('pk', filter=Q(channel=channel)) for channel, field in CHANNEL_FIELDS.items()}
+    for model_name, owner_field in (('CompanyStats', 'company_id'), ('ProjectStats', 'project_id')):
+        model = apps.get_model('management', model_name)
+        rows = interaction.objects.order_by().values(owner_field).annotate(
+            interaction_count=Count('pk'), grade_sum=Sum('grade'), last_interaction=Max('date_create'),
+            **channel_counts)
+        model.objects.bulk_create([model(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0005_alter_company_address'),
+        ('management', '0009_keywordmatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='interaction',
+            name='date_create',
+            field=models.DateField(null=True, verbose_name='Дата взаимодействия'),
+        ),
+        # added without auto_now_add, which would give every existing interaction the migration date
+        migrations.AlterField(
+            model_name='interaction',
+            name='date_create',
+            field=models.DateField(auto_now_add=True, null=True, verbose_name='Дата взаимодействия'),
+        ),
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interaction_count', models.PositiveIntegerField(default=0, verbose_name='Количество взаимодействий')),
+                ('grade_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('calls', models.PositiveIntegerField(default=0, verbose_name='Звонки')),
+                ('letters', models.PositiveIntegerField(default=0, verbose_name='Письма')),
+                ('emails', models.PositiveIntegerField(default=0, verbose_name='Email')),
+                ('sites', models.PositiveIntegerField(default=0, verbose_name='Сайт')),
+                ('last_interaction', models.DateField(blank=True, null=True, verbose_name='Дата последнего взаимодействия')),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='company.project', verbose_name='Проект')),
+            ],
+            options={
+                'verbose_name': 'Статистика проекта',
+                'verbose_name_plural': 'Статистика проектов',
+            },
+        ),
+        migrations.CreateModel(
+            name='CompanyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interaction_count', models.PositiveIntegerField(default=0, verbose_name='Количество взаимодействий')),
+                ('grade_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('calls', models.PositiveIntegerField(default=0, verbose_name='Звонки')),
+                ('letters', models.PositiveIntegerField(default=0, verbose_name='Письма')),
+                ('emails', models.PositiveIntegerField(default=0, verbose_name='Email')),
+                ('sites', models.PositiveIntegerField(default=0, verbose_name='Сайт')),
+                ('last_interaction', models.DateField(blank=True, null=True, verbose_name='Дата последнего взаимодействия')),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='company.company', verbose_name='Компания')),
+            ],
+            options={
+                'verbose_name': 'Статистика компании',
+                'verbose_name_plural': 'Статистика компаний',
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
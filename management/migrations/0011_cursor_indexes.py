@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0010_interaction_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['-grade', '-id'], name='interaction_grade_id_idx'),
+        ),
+    ]
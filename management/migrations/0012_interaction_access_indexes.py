@@ -0,0 +1,35 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0011_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(condition=models.Q(('manager__isnull', False)), fields=['manager', '-grade', '-id'], name='interaction_manager_grade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['company', 'project'], name='interaction_comp_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['company', '-id'], name='interaction_company_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['project', '-id'], name='interaction_project_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='interaction',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='interactions', to='company.company', verbose_name='Компания'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:09
+
+import crm.media
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0013_user_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=crm.media.ContentAddressedStorage(), upload_to='archives/', verbose_name='Фото'),
+        ),
+    ]
@@ -1,13 +1,21 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.urls import reverse
+from django_cleanup import cleanup
 from company.models import Company, Project
+from crm.media import ContentAddressedStorage
 
 
+@cleanup.ignore
 class User(AbstractUser):
-    """Model representing default user with photo and biography"""
-    photo = models.ImageField(verbose_name='Фото', upload_to='archives/', null=True, blank=True)
+    """Model representing default user with photo and biography
+
+    Photos are shared by content, unused ones are deleted by ``manage.py thumbnails gc``.
+    """
+    photo = models.ImageField(verbose_name='Фото', upload_to='archives/', storage=ContentAddressedStorage(),
+                              null=True, blank=True)
     bio = models.TextField(verbose_name='Биография', blank=True, null=True)
+    photo_thumbnails = models.JSONField(verbose_name='Миниатюры фото', default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.username
@@ -29,19 +37,84 @@ class Keyword(models.Model):
 class Interaction(models.Model):
     """Model representing an interaction between company and manager of crm"""
     project = models.ForeignKey(Project, verbose_name='Проект', on_delete=models.CASCADE)
-    company = models.ForeignKey(Company, verbose_name='Компания', on_delete=models.CASCADE)
+    # lookups by company use the composite indexes of Meta.indexes
+    company = models.ForeignKey(Company, verbose_name='Компания', on_delete=models.CASCADE, db_index=False)
     CHANNEL = (('Звонок', 'c'), ('Письмо', 'l'), ('Email', 'e'), ('Сайт', 's'))
     channel = models.CharField(verbose_name='Канал обращения', max_length=100, choices=CHANNEL)
     manager = models.ForeignKey(User, verbose_name='Менеджер', on_delete=models.SET_NULL, null=True)
     description = models.TextField(verbose_name='Описание')
     GRADE = ((1, 1), (2, 2), (3, 3), (4, 4), (5, 5))
     grade = models.IntegerField(verbose_name='Оценка', choices=GRADE)
+    # interactions recorded before the field was added have no date
+    date_create = models.DateField(verbose_name='Дата взаимодействия', auto_now_add=True, null=True)
 
     class Meta:
         verbose_name = 'Взаимодействие'
         verbose_name_plural = 'Взаимодействия'
         default_related_name = 'interactions'
+        indexes = [
+            models.Index(fields=['-grade', '-id'], name='interaction_grade_id_idx'),
+            models.Index(fields=['manager', '-grade', '-id'], name='interaction_manager_grade_idx',
+                         condition=models.Q(manager__isnull=False)),
+            models.Index(fields=['company', 'project'], name='interaction_comp_project_idx'),
+            models.Index(fields=['company', '-id'], name='interaction_company_id_idx'),
+            models.Index(fields=['project', '-id'], name='interaction_project_id_idx'),
+        ]
 
     def get_absolute_url(self):
         """Get url after successful creating or updating of current interaction"""
         return reverse('interaction_detail', kwargs={'pk': self.pk})
+
+
+class KeywordMatch(models.Model):
+    """Model representing a precomputed occurrence of a keyword in an interaction"""
+    keyword = models.ForeignKey(Keyword, verbose_name='Ключевое слово', on_delete=models.CASCADE, related_name='matches')
+    interaction = models.ForeignKey(Interaction, verbose_name='Взаимодействие', on_delete=models.CASCADE, related_name='keyword_matches')
+
+    class Meta:
+        verbose_name = 'Совпадение ключевого слова'
+        verbose_name_plural = 'Совпадения ключевых слов'
+        constraints = [models.UniqueConstraint(fields=['keyword', 'interaction'], name='unique_keyword_match')]
+
+
+class InteractionStats(models.Model):
+    """Abstract model representing denormalized interaction statistics of an owner"""
+    CHANNEL_FIELDS = {'Звонок': 'calls', 'Письмо': 'letters', 'Email': 'emails', 'Сайт': 'sites'}
+    interaction_count = models.PositiveIntegerField(verbose_name='Количество взаимодействий', default=0)
+    grade_sum = models.PositiveIntegerField(verbose_name='Сумма оценок', default=0)
+    calls = models.PositiveIntegerField(verbose_name='Звонки', default=0)
+    letters = models.PositiveIntegerField(verbose_name='Письма', default=0)
+    emails = models.PositiveIntegerField(verbose_name='Email', default=0)
+    sites = models.PositiveIntegerField(verbose_name='Сайт', default=0)
+    last_interaction = models.DateField(verbose_name='Дата последнего взаимодействия', null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def grade(self):
+        """Get mean grade or None if there are no interactions"""
+        return self.grade_sum / self.interaction_count if self.interaction_count else None
+
+    def channel_counts(self):
+        """Get non-empty channel counters as a list of dicts"""
+        return [{'channel': channel, 'count': getattr(self, field)}
+                for channel, field in self.CHANNEL_FIELDS.items() if getattr(self, field)]
+
+
+class CompanyStats(InteractionStats):
+    """Model representing interaction statistics of a company"""
+    company = models.OneToOneField(Company, verbose_name='Компания', on_delete=models.CASCADE, related_name='stats')
+
+    class Meta:
+        verbose_name = 'Статистика компании'
+        verbose_name_plural = 'Статистика компаний'
+
+
+class ProjectStats(InteractionStats):
+    """Model representing interaction statistics of a project"""
+    project = models.OneToOneField(Project, verbose_name='Проект', on_delete=models.CASCADE, related_name='stats')
+
+    class Meta:
+        verbose_name = 'Статистика проекта'
+        verbose_name_plural = 'Статистика проектов'
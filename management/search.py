@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'management_interaction_fts'
+SEARCH_CONFIG = 'simple'
+
+
+class BaseSearchBackend:
+    """Match interactions by exact tokens of channel and description"""
+
+    def search(self, qs, terms):
+        """Return queryset filtered by terms and ordered by rank"""
+        raise NotImplementedError
+
+    def index(self, interaction):
+        """Add or refresh an interaction in the search index"""
+
+    def remove(self, pk):
+        """Drop an interaction from the search index"""
+
+    def rebuild(self):
+        """Fill the search index from scratch"""
+
+    @staticmethod
+    def order_by_rank(qs):
+        """Put best matches first, keep view's ordering as tie-breaker"""
+        return qs.order_by('-search_rank', *qs.query.order_by)
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Search with tsvector and GIN index created in migration 0008"""
+
+    @staticmethod
+    def get_vector():
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector('channel', 'description', config=SEARCH_CONFIG)
+
+    def search(self, qs, terms):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        query = None
+        for term in terms:
+            term_query = SearchQuery(term, config=SEARCH_CONFIG, search_type='phrase')
+            query = term_query if query is None else query | term_query
+        vector = self.get_vector()
+        qs = qs.annotate(search_document=vector, search_rank=SearchRank(vector, query)).filter(search_document=query)
+        return self.order_by_rank(qs)
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    """Search with FTS5 virtual table kept in sync by signals"""
+
+    @staticmethod
+    def build_query(terms):
+        """Quote every term as a phrase so user input is never parsed as FTS syntax"""
+        return ' OR '.join('"%s"' % term.replace('"', '""') for term in terms)
+
+    def search(self, qs, terms):
+        match = self.build_query(terms)
+        table = qs.model._meta.db_table
+        qs = qs.filter(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+        qs = qs.annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = "{table}"."id"', [match]))
+        return self.order_by_rank(qs)
+
+    def index(self, interaction):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [interaction.pk])
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, channel, description) VALUES (%s, %s, %s)',
+                           [interaction.pk, interaction.channel, interaction.description])
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, channel, description) '
+                           f'SELECT id, channel, description FROM management_interaction')
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Fallback for databases without full-text support"""
+
+    def search(self, qs, terms):
+        condition = Q()
+        for term in terms:
+            condition |= Q(channel__iexact=term) | Q(description__icontains=term)
+        return qs.filter(condition)
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_search_backend():
+    """Get backend from INTERACTION_SEARCH_BACKEND setting or by database vendor"""
+    path = getattr(settings, 'INTERACTION_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)()
+
+
+def search_interactions(qs, terms):
+    """Filter interactions queryset by keywords, best matches first"""
+    terms = [term.strip() for term in terms if term.strip()]
+    if not terms:
+        return qs
+    return get_search_backend().search(qs, terms)
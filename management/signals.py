@@ -0,0 +1,72 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from company.cache import INTERACTIONS, KEYWORDS, PERMISSIONS, USERS, bump_versions
+from crm.permissions import forget_user
+from . import stats
+from .keywords import match_interaction, match_keyword
+from .models import Interaction, Keyword, User
+from .search import get_search_backend
+
+
+@receiver(pre_save, sender=Interaction)
+def remember_interaction(sender, instance, **kwargs):
+    """Keep stored values of an edited interaction to correct statistics after save"""
+    instance._stats_previous = None
+    if instance.pk:
+        instance._stats_previous = Interaction.objects.filter(pk=instance.pk).values(*stats.TRACKED_FIELDS).first()
+
+
+@receiver(post_save, sender=Interaction)
+def index_interaction(sender, instance, **kwargs):
+    """Keep search index, keyword matches and statistics in sync after an interaction is saved"""
+    get_search_backend().index(instance)
+    match_interaction(instance)
+    previous = getattr(instance, '_stats_previous', None)
+    current = stats.snapshot(instance)
+    if previous != current:
+        if previous:
+            stats.remove_interaction(previous)
+        stats.add_interaction(current)
+    bump_versions(INTERACTIONS)
+
+
+@receiver(post_delete, sender=Interaction)
+def unindex_interaction(sender, instance, **kwargs):
+    """Drop deleted interaction from search index and statistics"""
+    get_search_backend().remove(instance.pk)
+    stats.remove_interaction(stats.snapshot(instance))
+    bump_versions(INTERACTIONS)
+
+
+@receiver(post_save, sender=Keyword)
+def index_keyword(sender, instance, **kwargs):
+    """Store matches of a new or renamed keyword"""
+    match_keyword(instance)
+
+
+@receiver(post_save, sender=Keyword)
+@receiver(post_delete, sender=Keyword)
+def invalidate_keywords(sender, **kwargs):
+    """Keyword lists and keyword match counts are read from cached responses"""
+    bump_versions(KEYWORDS, INTERACTIONS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_users(sender, instance, **kwargs):
+    """Manager names are shown with interactions, users of sessions are cached"""
+    forget_user(instance.pk)
+    bump_versions(USERS)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_permissions(sender, action=None, **kwargs):
+    """Permission sets of users are cached by crm.permissions.CachedModelBackend"""
+    if action is None or action.startswith('post_'):
+        bump_versions(PERMISSIONS)
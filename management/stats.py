@@ -0,0 +1,59 @@
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Greatest
+from .models import CompanyStats, Interaction, InteractionStats, ProjectStats
+
+STATS_OWNERS = ((CompanyStats, 'company_id'), (ProjectStats, 'project_id'))
+TRACKED_FIELDS = ('company_id', 'project_id', 'channel', 'grade', 'date_create')
+
+
+def snapshot(interaction):
+    """Get values of an interaction that affect statistics"""
+    return {field: getattr(interaction, field) for field in TRACKED_FIELDS}
+
+
+def add_interaction(values):
+    """Count interaction in statistics of its company and project"""
+    for model, owner_field in STATS_OWNERS:
+        stats, _ = model.objects.get_or_create(**{owner_field: values[owner_field]})
+        rows = model.objects.filter(pk=stats.pk)
+        rows.update(**counters(values, 1))
+        if values['date_create'] is None:
+            continue
+        rows.filter(Q(last_interaction__isnull=True) | Q(last_interaction__lt=values['date_create'])) \
+            .update(last_interaction=values['date_create'])
+
+
+def remove_interaction(values):
+    """Subtract interaction from statistics of its company and project"""
+    for model, owner_field in STATS_OWNERS:
+        rows = model.objects.filter(**{owner_field: values[owner_field]})
+        rows.update(**counters(values, -1))
+        if values['date_create'] is not None and rows.filter(last_interaction=values['date_create']).exists():
+            last = Interaction.objects.filter(**{owner_field: values[owner_field]}).aggregate(last=Max('date_create'))
+            rows.update(last_interaction=last['last'])
+
+
+def counters(values, sign):
+    """Get expressions moving counters by one interaction
+
+    Subtraction stops at zero: counters that drifted after bulk changes
+    bypassing signals must not fail a delete, recompute_stats fixes them.
+    """
+    changes = {'interaction_count': 1, 'grade_sum': values['grade']}
+    field = InteractionStats.CHANNEL_FIELDS.get(values['channel'])
+    if field:
+        changes[field] = 1
+    if sign > 0:
+        return {name: F(name) + change for name, change in changes.items()}
+    return {name: Greatest(F(name) - change, 0) for name, change in changes.items()}
+
+
+def recompute(model, owner_field):
+    """Rebuild all statistics records of one owner type from interactions, return number of records"""
+    channel_counts = {field: Count('pk', filter=Q(channel=channel))
+                      for channel, field in InteractionStats.CHANNEL_FIELDS.items()}
+    rows = Interaction.objects.order_by().values(owner_field).annotate(
+        interaction_count=Count('pk'), grade_sum=Sum('grade'), last_interaction=Max('date_create'), **channel_counts)
+    model.objects.all().delete()
+    model.objects.bulk_create([model(**row) for row in rows], batch_size=1000)
+    return len(rows)
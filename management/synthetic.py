@@ -0,0 +1,74 @@
+import datetime
+import random
+import uuid
+from django.contrib.auth.hashers import make_password
+from company.models import Company, CompanyEmail, CompanyManager, Phone, Project
+from company.cache import COMPANIES, INTERACTIONS, KEYWORDS, PROJECTS, USERS, bump_versions
+from company.services import bulk_create_with_pks as bulk_insert
+from . import keywords, stats
+from .models import Interaction, Keyword, User
+from .search import get_search_backend
+
+WORDS = ('contract', 'invoice', 'meeting', 'delivery', 'discount', 'support', 'payment', 'offer', 'call', 'order')
+NAMES = ('Ivan', 'Olena', 'Petro', 'Maria', 'Taras', 'Oksana', 'Andrii', 'Iryna')
+SURNAMES = ('Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Melnyk')
+
+
+def sentence(size=8):
+    return ' '.join(random.choice(WORDS) for _ in range(size))
+
+
+def generate(companies=100, contacts=2, phones=2, emails=2, projects=3, interactions=1000, keywords_count=10,
+             users=10, batch_size=1000):
+    """Fill the database with synthetic CRM data and rebuild derived tables, return inserted row counts"""
+    today = datetime.date.today()
+    tag = uuid.uuid4().hex[:8]
+    password = make_password(None)
+    user_rows = bulk_insert(User, [User(username=f'user_{tag}_{i}', password=password, is_staff=True,
+                                        first_name=random.choice(NAMES), last_name=random.choice(SURNAMES))
+                                   for i in range(users)], batch_size)
+    company_rows = bulk_insert(Company, [Company(name=f'Company {tag} {i}', address=f'Kyiv, street {i}',
+                                                 description=f'<p>{sentence()}</p>')
+                                         for i in range(companies)], batch_size)
+    counts = {'users': len(user_rows), 'companies': len(company_rows)}
+    counts['contacts'] = len(bulk_insert(CompanyManager, [
+        CompanyManager(company=company, name=random.choice(NAMES), surname=random.choice(SURNAMES),
+                       manager_position='Manager')
+        for company in company_rows for _ in range(contacts)], batch_size))
+    counts['phones'] = len(bulk_insert(Phone, [Phone(company=company, phone=f'0{random.randrange(10 ** 9):09d}')
+                                               for company in company_rows for _ in range(phones)], batch_size))
+    counts['emails'] = len(bulk_insert(CompanyEmail, [
+        CompanyEmail(company=company, company_email=f'{tag}.{company.pk}.{i}@example.com')
+        for company in company_rows for i in range(emails)], batch_size))
+    project_rows = bulk_insert(Project, [Project(project=f'Project {company.pk}-{i}', company=company,
+                                                 description=sentence(), start_date=today,
+                                                 final_date=today + datetime.timedelta(days=30), price=1000)
+                                         for company in company_rows for i in range(projects)], batch_size)
+    counts['projects'] = len(project_rows)
+    candidates = list(WORDS) + [f'{first} {second}' for first in WORDS for second in WORDS if first != second]
+    existing = set(Keyword.objects.filter(keyword__in=candidates).values_list('keyword', flat=True))
+    new_keywords = [Keyword(keyword=keyword) for keyword in candidates if keyword not in existing][:keywords_count]
+    counts['keywords'] = len(bulk_insert(Keyword, new_keywords, batch_size))
+    channels = [channel for channel, _ in Interaction.CHANNEL]
+    created, batch = 0, []
+    for _ in range(interactions if project_rows else 0):
+        project = random.choice(project_rows)
+        batch.append(Interaction(project=project, company_id=project.company_id, channel=random.choice(channels),
+                                 manager=random.choice(user_rows) if user_rows else None,
+                                 description=sentence(random.randint(5, 30)), grade=random.randint(1, 5)))
+        if len(batch) == batch_size:
+            created += len(Interaction.objects.bulk_create(batch))
+            batch = []
+    created += len(Interaction.objects.bulk_create(batch))
+    counts['interactions'] = created
+    rebuild_derived()
+    return counts
+
+
+def rebuild_derived():
+    """Refresh search index, keyword matches, statistics and cache versions skipped by bulk inserts"""
+    get_search_backend().rebuild()
+    keywords.backfill()
+    for model, owner_field in stats.STATS_OWNERS:
+        stats.recompute(model, owner_field)
+    bump_versions(COMPANIES, PROJECTS, INTERACTIONS, KEYWORDS, USERS)
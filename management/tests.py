@@ -1,3 +1,645 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import re
+import tempfile
+import time
+from importlib import import_module
+from unittest import mock
+from PIL import Image
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.db.backends.sqlite3 import base as sqlite_base
+from django.db.migrations.loader import MigrationLoader
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from company.cache import INTERACTIONS, bump_versions
+from company.tests import QueryBudgetTestCase
+from crm import asgi, database, metrics, passwords
+from . import keywords, search, thumbnails, views
+from .forms import UserForm
+from .models import CompanyStats, Interaction, Keyword, KeywordMatch, ProjectStats, User
 
-# Create your tests here.
+
+class InteractionQueryCountTest(QueryBudgetTestCase):
+    """Query budgets of interaction and manager views"""
+
+    def test_interaction_list(self):
+        self.assertMaxQueries(3, reverse('interaction_list'))
+
+    def test_interaction_list_filtered(self):
+        self.assertMaxQueries(4, reverse('interaction_list') + '?q=contract&q=Email')
+
+    def test_interaction_by_manager_list(self):
+        self.assertMaxQueries(3, reverse('interaction_by_manager_list'))
+
+    def test_interaction_list_rows_load_rendered_columns(self):
+        response = self.client.get(reverse('interaction_list'))
+        with self.assertNumQueries(0):
+            rows = [f'{row.channel} {row.company} ({row.project})' for row in response.context['object_list']]
+        self.assertEqual(rows[0], 'Email Компания Company 4 (Project 4)')
+        self.assertContains(response, 'value="Сайт"')
+
+    def test_interaction_export_filtered(self):
+        response = self.assertMaxQueries(6, reverse('interaction_export') + '?q=contract&q=Email')
+        lines = response.streamed.lstrip('\ufeff').splitlines()
+        self.assertEqual(lines[0], 'id,date_create,company,project,channel,manager,grade,description')
+        self.assertEqual(len(lines), self.rows ** 2 + 1)
+
+    def test_interaction_export_keeps_filter(self):
+        response = self.assertMaxQueries(6, reverse('interaction_export') + '?q=Сайт&format=jsonl')
+        self.assertEqual(response.streamed, '')
+
+    def test_interaction_detail(self):
+        self.assertMaxQueries(5, reverse('interaction_detail', kwargs={'pk': self.interaction.pk}))
+
+    def test_interaction_create(self):
+        self.assertMaxQueries(5, reverse('interaction_create'))
+
+    def test_interaction_update(self):
+        self.assertMaxQueries(6, reverse('interaction_update', kwargs={'pk': self.interaction.pk}))
+
+    def test_interaction_delete(self):
+        self.assertMaxQueries(3, reverse('interaction_delete', kwargs={'pk': self.interaction.pk}))
+
+    def test_keyword_create(self):
+        self.assertMaxQueries(2, reverse('keyword_create'))
+
+    def test_manager_detail(self):
+        self.assertMaxQueries(2, reverse('manager_detail'))
+
+    def test_manager_update(self):
+        self.assertMaxQueries(2, reverse('manager_update'))
+
+    def test_manager_update_refreshes_cached_user(self):
+        self.assertContains(self.client.get(reverse('manager_detail')), self.user.username)
+        self.client.post(reverse('manager_update'), {'username': 'renamed', 'password': self.user.password})
+        self.assertContains(self.assertMaxQueries(1, reverse('manager_detail')), 'renamed')
+
+
+class SearchBackendTest(QueryBudgetTestCase):
+    """Full-text search of interactions on SQLite FTS5 and the simple fallback"""
+
+    def search(self, backend, *terms):
+        return list(backend.search(Interaction.objects.order_by('pk'), terms).values_list('pk', flat=True))
+
+    def test_sqlite_index_follows_save_and_delete(self):
+        backend = search.SqliteSearchBackend()
+        self.assertEqual(self.search(backend, 'renewal'), [])
+        self.interaction.description = 'renewal of the contract'
+        self.interaction.save()
+        self.assertEqual(self.search(backend, 'renewal'), [self.interaction.pk])
+        self.assertNotIn(self.interaction.pk, self.search(backend, 'call'))
+        pk = self.interaction.pk
+        self.interaction.delete()
+        self.assertEqual(self.search(backend, 'renewal'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {search.FTS_TABLE} WHERE rowid = %s', [pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_sqlite_ranking(self):
+        backend = search.SqliteSearchBackend()
+        once = Interaction.objects.create(project=self.project, company=self.company, channel='Email', grade=1,
+                                          manager=self.user, description='invoice sent with a long list of notes')
+        twice = Interaction.objects.create(project=self.project, company=self.company, channel='Email', grade=1,
+                                           manager=self.user, description='invoice invoice')
+        self.assertEqual(self.search(backend, 'invoice'), [twice.pk, once.pk])
+        self.assertEqual(self.search(backend, 'invoice" OR "call'), [])
+
+    def test_simple_backend(self):
+        backend = search.SimpleSearchBackend()
+        self.assertEqual(len(self.search(backend, 'email')), self.rows ** 2)
+        self.assertEqual(len(self.search(backend, 'CONTRACT 1', 'contract 2')), 2 * self.rows)
+        self.interaction.description = 'renewal'
+        self.interaction.save()
+        self.assertEqual(self.search(backend, 'renewal'), [self.interaction.pk])
+        with override_settings(INTERACTION_SEARCH_BACKEND='management.search.SimpleSearchBackend'):
+            self.assertEqual(list(search.search_interactions(Interaction.objects.all(), [' renewal '])),
+                             [self.interaction])
+
+
+class KeywordMatchTest(QueryBudgetTestCase):
+    """Stored keyword matches follow keywords and interactions"""
+
+    def setUp(self):
+        super().setUp()
+        self.keyword = Keyword.objects.get(keyword='contract')
+
+    def matched(self, keyword):
+        return set(KeywordMatch.objects.filter(keyword=keyword).values_list('interaction_id', flat=True))
+
+    def test_keyword_rename(self):
+        self.assertEqual(len(self.matched(self.keyword)), self.rows ** 2)
+        self.keyword.keyword = 'Contract 3'
+        self.keyword.save()
+        self.assertEqual(self.matched(self.keyword),
+                         set(Interaction.objects.filter(description__endswith='3').values_list('pk', flat=True)))
+        self.keyword.keyword = 'tract'
+        self.keyword.save()
+        self.assertEqual(self.matched(self.keyword), set())
+
+    def test_interaction_edit_stops_matching(self):
+        self.interaction.description = 'call about the invoice'
+        self.interaction.save()
+        self.assertNotIn(self.interaction.pk, self.matched(self.keyword))
+        Interaction.objects.filter(pk=self.interaction.pk).update(description='contract signed')
+        self.assertNotIn(self.interaction.pk, self.matched(self.keyword))
+        keywords.match_interaction(Interaction.objects.get(pk=self.interaction.pk))
+        self.assertIn(self.interaction.pk, self.matched(self.keyword))
+
+    def test_match_keyword_replaces_matches(self):
+        KeywordMatch.objects.filter(keyword=self.keyword).delete()
+        keywords.match_keyword(self.keyword)
+        self.assertEqual(len(self.matched(self.keyword)), self.rows ** 2)
+
+    def test_delete(self):
+        self.interaction.delete()
+        self.assertEqual(len(self.matched(self.keyword)), self.rows ** 2 - 1)
+        self.keyword.delete()
+        self.assertFalse(KeywordMatch.objects.exists())
+
+
+class FacetTest(QueryBudgetTestCase):
+    """Facet counts ignore their own facet's selection, only counts queried by the request size the page"""
+
+    def get_counts(self, response, name):
+        facet = next(facet for facet in response.context['view'].get_facets() if facet['name'] == name)
+        return {item['value']: item['count'] for item in facet['values']}
+
+    def test_counts_and_filtered_page(self):
+        response = self.client.get(reverse('interaction_list'), {'grade': ['5', 'x'], 'company': self.company.pk})
+        self.assertEqual([row.grade for row in response.context['object_list']], [5])
+        self.assertEqual(self.get_counts(response, 'grade'), {1: 1, 2: 1, 3: 1, 4: 1, 5: 1})
+        self.assertEqual(set(self.get_counts(response, 'company').values()), {1})
+        self.assertEqual(self.get_counts(response, 'channel')['Email'], 1)
+        self.assertContains(response, 'contract (1)')
+
+    def test_next_page_keeps_filter_and_counts(self):
+        url = reverse('interaction_list') + '?channel=Email&grade=5&grade=4&grade=3'
+        self.assertContains(self.client.get(url), '?page=2&channel=Email&amp;grade=5&amp;grade=4&amp;grade=3')
+        response = self.assertMaxQueries(2, url + '&page=2')
+        self.assertEqual(response.context['paginator'].count, 15)
+        self.assertEqual(len(response.context['object_list']), 5)
+
+    def test_pages_not_cut_by_stale_counts(self):
+        url = reverse('interaction_list') + '?grade=2'
+        self.client.get(url)
+        Interaction.objects.filter(grade=1).update(grade=2)
+        response = self.client.get(url)
+        self.assertEqual(response.context['paginator'].count, 10)
+        self.assertEqual(len(response.context['object_list']), 10)
+
+    def test_project_labeled_with_company(self):
+        response = self.client.get(reverse('interaction_list'))
+        self.assertContains(response, f'{self.project.project} ({self.company.name}) (1)')
+
+
+class StatsTest(QueryBudgetTestCase):
+    """Company and project statistics follow created, edited and deleted interactions"""
+    fields = ('interaction_count', 'grade_sum', 'calls', 'emails', 'last_interaction')
+
+    def get_stats(self, model, **owner):
+        return model.objects.filter(**owner).values(*self.fields).get()
+
+    def test_create(self):
+        Interaction.objects.create(project=self.project, company=self.company, channel='Звонок', grade=5,
+                                   manager=self.user, description='new')
+        stats = self.get_stats(CompanyStats, company=self.company)
+        self.assertEqual((stats['interaction_count'], stats['grade_sum'], stats['calls'], stats['emails']), (6, 20, 1, 5))
+        self.assertEqual(self.get_stats(ProjectStats, project=self.project)['interaction_count'], 2)
+
+    def test_edit_moves_counters(self):
+        other = self.company.project_set.exclude(pk=self.project.pk).first()
+        self.interaction.project, self.interaction.channel, self.interaction.grade = other, 'Звонок', 4
+        self.interaction.save()
+        self.assertEqual(self.get_stats(ProjectStats, project=self.project)['interaction_count'], 0)
+        moved = self.get_stats(ProjectStats, project=other)
+        self.assertEqual((moved['interaction_count'], moved['calls'], moved['emails']), (2, 1, 1))
+        stats = self.get_stats(CompanyStats, company=self.company)
+        self.assertEqual((stats['interaction_count'], stats['grade_sum'], stats['calls']), (5, 18, 1))
+
+    def test_delete(self):
+        self.interaction.delete()
+        project = self.get_stats(ProjectStats, project=self.project)
+        self.assertEqual((project['interaction_count'], project['last_interaction']), (0, None))
+        stats = self.get_stats(CompanyStats, company=self.company)
+        self.assertEqual((stats['interaction_count'], stats['grade_sum']), (4, 14))
+
+    def test_delete_after_drift_keeps_counters_at_zero(self):
+        ProjectStats.objects.filter(project=self.project).update(interaction_count=0, grade_sum=0, emails=0)
+        self.interaction.delete()
+        project = self.get_stats(ProjectStats, project=self.project)
+        self.assertEqual((project['interaction_count'], project['grade_sum'], project['emails']), (0, 0, 0))
+
+    def test_migration_backfill_matches_signals(self):
+        expected = list(CompanyStats.objects.order_by('company').values('company', *self.fields))
+        CompanyStats.objects.all().delete()
+        ProjectStats.objects.all().delete()
+        state = MigrationLoader(connection).project_state(('management', '0010_interaction_stats'))
+        import_module('management.migrations.0010_interaction_stats').backfill_stats(state.apps, None)
+        self.assertEqual(list(CompanyStats.objects.order_by('company').values('company', *self.fields)), expected)
+        self.assertEqual(ProjectStats.objects.count(), self.rows ** 2)
+
+
+class PermissionTest(QueryBudgetTestCase):
+    """Interactions are changed by their managers only, permission sets are cached between requests"""
+
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(name='managers')
+        self.group.permissions.set(Permission.objects.filter(codename__in=['view_interaction', 'change_interaction']))
+        self.other = User.objects.create_user('other', password='secret', is_staff=True)
+        self.other.groups.add(self.group)
+        self.client.force_login(self.other)
+
+    def test_other_manager_forbidden(self):
+        self.assertMaxQueries(5, reverse('interaction_update', kwargs={'pk': self.interaction.pk}), status_code=403)
+
+    def test_permissions_cached_until_changed(self):
+        url = reverse('interaction_detail', kwargs={'pk': self.interaction.pk})
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url)
+        self.assertMaxQueries(len(first) - 2, url)
+        self.group.permissions.remove(Permission.objects.get(codename='view_interaction'))
+        self.assertMaxQueries(len(first), url, status_code=403)
+
+    def test_leaving_group_revokes_permissions(self):
+        url = reverse('interaction_detail', kwargs={'pk': self.interaction.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.other.groups.remove(self.group)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_deleting_group_revokes_permissions(self):
+        url = reverse('interaction_detail', kwargs={'pk': self.interaction.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.group.delete()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_unsignaled_revocation_expires(self):
+        """Rows of auto-created m2m tables changed with QuerySet methods send no signals, the timeout bounds them"""
+        url = reverse('interaction_detail', kwargs={'pk': self.interaction.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        Group.permissions.through.objects.filter(group=self.group, permission__codename='view_interaction').delete()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        later = time.time() + settings.PERMISSION_CACHE_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class PasswordTest(QueryBudgetTestCase):
+    """Passwords are hashed only when changed, failed logins are throttled"""
+
+    def test_profile_edit_keeps_password_hash(self):
+        data = {'username': self.user.username, 'email': 'new@example.com', 'password': self.user.password}
+        with mock.patch('crm.passwords.run_hashing') as run_hashing:
+            self.client.post(reverse('manager_update'), data)
+        run_hashing.assert_not_called()
+        self.assertEqual(User.objects.get(pk=self.user.pk).password, self.user.password)
+
+    def test_password_change_hashed_and_session_kept(self):
+        self.client.post(reverse('manager_update'), {'username': self.user.username, 'password': 'new secret'})
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.password.startswith('argon2$') and user.check_password('new secret'))
+        self.assertEqual(self.client.get(reverse('manager_detail')).status_code, 200)
+
+    @override_settings(LOGIN_ATTEMPTS_PER_USER=2)
+    def test_login_throttled(self):
+        self.client.logout()
+        url = reverse('login')
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {'username': 'manager', 'password': 'wrong'}).status_code, 200)
+        self.assertContains(self.client.post(url, {'username': 'manager', 'password': 'password'}),
+                            'Слишком много неудачных попыток', status_code=429)
+        self.assertEqual(self.client.post(url, {'username': 'other', 'password': 'wrong'}).status_code, 200)
+
+    def test_pbkdf2_verified_in_pool(self):
+        self.assertIsInstance(hashers.get_hasher('pbkdf2_sha256'), passwords.PBKDF2PasswordHasher)
+        encoded = hashers.make_password('secret', hasher='pbkdf2_sha256')
+        with mock.patch('crm.passwords.run_hashing', side_effect=lambda func, *args: func(*args)) as run_hashing:
+            self.assertTrue(hashers.check_password('secret', encoded))
+        run_hashing.assert_called()
+
+    def test_scrypt_hasher(self):
+        hasher = passwords.ScryptPasswordHasher()
+        encoded = hasher.encode('secret', hasher.salt())
+        self.assertTrue(hasher.verify('secret', encoded))
+        self.assertFalse(hasher.verify('wrong', encoded))
+        self.assertFalse(hasher.must_update(encoded))
+        self.assertTrue(hasher.must_update(hasher.encode('secret', hasher.salt(), work_factor=2 ** 10)))
+
+
+class InteractionApiTest(QueryBudgetTestCase):
+    """Read-only JSON API of interactions, keywords and manager profile"""
+
+    def test_interaction_list_filtered(self):
+        response = self.assertMaxQueries(6, reverse('api_interaction_list') + '?q=Email&fields=id,company_name')
+        data = response.json()['data']
+        self.assertEqual(len(data), self.rows ** 2)
+        self.assertEqual(set(data[0]), {'id', 'company_name'})
+
+    def test_search_results_paged_by_number(self):
+        url, ids = reverse('api_interaction_list') + '?q=call&limit=10&fields=id', []
+        while url:
+            body = self.client.get(url).json()
+            ids.extend(row['id'] for row in body['data'])
+            url = body['next']
+        self.assertEqual(len(ids), self.rows ** 2)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertIn('page=2', body['previous'])
+
+    def test_interaction_etag_changes_after_save(self):
+        url = reverse('api_interaction_detail', kwargs={'pk': self.interaction.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.interaction.grade = 5
+        self.interaction.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['data']['grade'], 5)
+
+    def test_keywords_and_manager(self):
+        self.assertEqual(self.client.get(reverse('api_keyword_list')).json()['data'], [
+            {'id': Keyword.objects.get().pk, 'keyword': 'contract'}])
+        profile = self.client.get(reverse('api_manager_detail')).json()['data']
+        self.assertEqual((profile['username'], profile['photo']), ('manager', None))
+
+    def test_permission_required(self):
+        self.client.force_login(User.objects.create_user('guest'))
+        self.assertEqual(self.client.get(reverse('api_interaction_list')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('api_company_list')).status_code, 200)
+
+
+@override_settings(ASYNC_DB_THREADS=0)
+class AsyncViewTest(QueryBudgetTestCase):
+    """Async interaction views render the same pages as sync ones"""
+
+    def get(self, view_class, path, **kwargs):
+        request = RequestFactory().get(path)
+        request.user = self.user
+        view = view_class.as_view()
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        response = view(request, **kwargs)
+        return re.sub(r'value="\w+"', '', response.render().content.decode(), count=1)
+
+    def test_interaction_list(self):
+        self.assertTrue(asyncio.iscoroutinefunction(views.AsyncInteractionList.as_view()))
+        path = '/?q=contract'
+        self.assertEqual(self.get(views.AsyncInteractionList, path), self.get(views.InteractionList, path))
+
+    def test_interaction_list_by_manager_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            content = self.get(views.AsyncInteractionListByManager, '/')
+        self.assertIn('contract (25)', content)
+        self.assertLessEqual(len(context.captured_queries), 3)
+
+    def test_interaction_detail(self):
+        content = self.get(views.AsyncInteractionDetail, '/', pk=self.interaction.pk)
+        self.assertIn(self.interaction.description, content)
+
+    def test_export_streamed_by_asgi_application(self):
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        scope = {'type': 'http', 'scheme': 'https', 'method': 'GET', 'path': reverse('interaction_export'),
+                 'query_string': b'', 'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())]}
+
+        async def request():
+            communicator = ApplicationCommunicator(asgi.application, scope)
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(10)
+            body = b''
+            while True:
+                message = await communicator.receive_output(10)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    return start, body
+
+        with mock.patch('management.views.InteractionExport.chunk_size', 4):
+            start, body = async_to_sync(request)()
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(len(body.decode().lstrip('\ufeff').splitlines()), self.rows ** 2 + 1)
+
+
+class MetricsTest(QueryBudgetTestCase):
+    """Per-request metrics and the Server-Timing header"""
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_server_timing_for_staff(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('interaction_list'))
+        match = re.fullmatch(r'app;dur=[\d.]+, db;dur=[\d.]+;desc="(\d+) queries", tpl;dur=[\d.]+',
+                             response['Server-Timing'])
+        self.assertEqual(int(match[1]), len(context.captured_queries))
+
+    def test_server_timing_hidden_from_others(self):
+        self.client.force_login(User.objects.create_user('clerk', 'clerk@example.com', 'password'))
+        self.assertNotIn('Server-Timing', self.client.get(reverse('manager_detail')))
+        self.client.logout()
+        self.assertNotIn('Server-Timing', self.client.get(reverse('login')))
+        with override_settings(SERVER_TIMING=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('login')))
+
+    def test_counters_and_exposition(self):
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(2):
+                self.client.get(reverse('interaction_list'))
+        queries = metrics.registry.snapshot()['interaction_list']['queries']
+        self.assertEqual(queries['count'], 2)
+        self.assertEqual(queries['mean'], len(context.captured_queries) / 2)
+        text = metrics.registry.prometheus()
+        self.assertIn('# TYPE crm_request_queries histogram', text)
+        self.assertIn('crm_request_queries_bucket{view="interaction_list",le="+Inf"} 2', text)
+        self.assertIn(f'crm_request_queries_sum{{view="interaction_list"}} {len(context.captured_queries)}', text)
+        self.assertIn('crm_request_wall_ms_count{view="interaction_list"} 2', text)
+        response = self.client.get(reverse('metrics_prometheus'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTest(SimpleTestCase):
+    """Choice of the read alias and read-your-writes pinning"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = database.database_middleware(
+            lambda request: HttpResponse(database.ReplicaRouter().db_for_read(Interaction)))
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.middleware(self.factory.get('/')).content, b'replica')
+        self.assertIsNone(database.read_alias.get())
+
+    def test_post_reads_primary_and_pins_user(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertEqual(response.content, b'None')
+        self.assertEqual(response.cookies[database.PIN_COOKIE]['max-age'], 10)
+        self.factory.cookies[database.PIN_COOKIE] = '1'
+        self.assertEqual(self.middleware(self.factory.get('/')).content, b'None')
+
+    def test_writes_pin_only_the_writer(self):
+        bump_versions(INTERACTIONS)
+        self.assertEqual(self.middleware(self.factory.get('/')).content, b'replica')
+
+    def test_replicas_are_not_migrated(self):
+        router = database.ReplicaRouter()
+        self.assertIs(router.allow_migrate('replica', 'management'), False)
+        self.assertIsNone(router.allow_migrate('default', 'management'))
+        self.assertEqual(router.db_for_write(Interaction), 'default')
+
+    def test_database_cache_read_from_primary(self):
+        entry = DatabaseCache('crm_cache', {}).cache_model_class
+        middleware = database.database_middleware(
+            lambda request: HttpResponse(database.ReplicaRouter().db_for_read(entry)))
+        self.assertEqual(middleware(self.factory.get('/')).content, b'default')
+
+    def test_reused_connection_checked_once_per_request(self):
+        wrapper = type('DatabaseWrapper', (database.HealthCheckMixin, sqlite_base.DatabaseWrapper), {})
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, 'health.sqlite3')
+        connection = wrapper({**connections['default'].settings_dict, 'NAME': name}, 'health')
+        self.addCleanup(connection.close)
+        with mock.patch.object(wrapper, 'is_usable', return_value=False) as is_usable:
+            connection.cursor().close()
+            is_usable.assert_not_called()
+            broken = connection.connection
+            connection.health_check_done = False
+            connection.cursor().close()
+            connection.cursor().close()
+        is_usable.assert_called_once()
+        self.assertIsNot(connection.connection, broken)
+
+    def test_middleware_marks_connections(self):
+        connection = connections['default']
+        self.addCleanup(vars(connection).pop, 'health_check_done', None)
+        with mock.patch.dict(connection.settings_dict, CONN_HEALTH_CHECKS=True):
+            database.check_connections()
+        self.assertIs(connection.health_check_done, False)
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTest(QueryBudgetTestCase):
+    """Uploaded photos are processed and deduplicated, thumbnails are generated after upload and read from the user row"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.media_root = media.name
+
+    @staticmethod
+    def make_image(size=(600, 400), image_format='PNG', **options):
+        image = io.BytesIO()
+        Image.new('RGB', size, 'red').save(image, image_format, **options)
+        return image.getvalue()
+
+    def upload_photo(self, content=None, status=302):
+        user = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('manager_update'), {
+                'username': user.username, 'password': user.password, 'email': user.email,
+                'photo': SimpleUploadedFile('photo.png', content or self.make_image(), 'image/png'),
+            })
+        self.assertEqual(response.status_code, status)
+        return User.objects.get(pk=self.user.pk)
+
+    def test_photo_processed_and_deduplicated(self):
+        exif = Image.Exif()
+        exif[0x0110] = 'Camera'
+        content = self.make_image((4000, 3000), 'JPEG', exif=exif.tobytes())
+        user = self.upload_photo(content)
+        self.assertRegex(user.photo.name, r'^archives/[0-9a-f]{2}/[0-9a-f]{64}\.webp$')
+        with Image.open(user.photo.path) as image:
+            self.assertEqual(image.size, (2048, 1536))
+            self.assertFalse(image.getexif())
+        other = User.objects.create_user('other', password='secret')
+        form = UserForm(instance=other, data={'username': 'other', 'password': other.password},
+                        files={'photo': SimpleUploadedFile('copy.jpg', content, 'image/jpeg')})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().photo.name, user.photo.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(user.photo.path))), 1)
+
+    @override_settings(UPLOAD_MAX_PIXELS=1000)
+    def test_photo_over_pixel_limit_rejected(self):
+        self.assertFalse(self.upload_photo(status=200).photo)
+
+    def test_ckeditor_upload_processed(self):
+        response = self.client.post(reverse('ckeditor_upload'), {
+            'upload': SimpleUploadedFile('picture.png', self.make_image(), 'image/png'),
+        })
+        data = response.json()
+        self.assertRegex(data['url'], rf'^{settings.MEDIA_URL}uploads/[0-9a-f]{{2}}/[0-9a-f]{{64}}\.webp$')
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, data['url'][len(settings.MEDIA_URL):])))
+
+    def test_thumbnails_generated_after_upload(self):
+        user = self.upload_photo()
+        url = user.photo_thumbnails['detail']
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, url[len(settings.MEDIA_URL):])))
+        response = self.assertMaxQueries(3, reverse('manager_detail'))
+        self.assertContains(response, f'src="{url}"')
+
+    def test_garbage_collection_keeps_used_thumbnails(self):
+        user = self.upload_photo()
+        stray = os.path.join(self.media_root, 'cache', 'aa', 'bb', 'stray.jpg')
+        os.makedirs(os.path.dirname(stray))
+        open(stray, 'wb').close()
+        self.assertEqual(thumbnails.collect_garbage(), ['cache/aa/bb/stray.jpg'])
+        self.assertFalse(os.path.exists(os.path.dirname(stray)))
+        self.assertEqual(thumbnails.collect_garbage(), [])
+        User.objects.filter(pk=user.pk).update(photo_thumbnails={})
+        self.assertEqual(thumbnails.warm(), 1)
+        self.assertEqual(User.objects.get(pk=user.pk).photo_thumbnails, user.photo_thumbnails)
+
+
+class MediaServingTest(SimpleTestCase):
+    """Media files are served with cache headers and byte ranges"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name, MEDIA_SENDFILE='')
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.name = f'archives/ab/{"ab" * 32}.webp'
+        os.makedirs(os.path.join(media.name, 'archives', 'ab'))
+        with open(os.path.join(media.name, self.name), 'wb') as file:
+            file.write(b'0123456789')
+
+    def get(self, name, **headers):
+        return self.client.get(settings.MEDIA_URL + name, secure=True, **headers)
+
+    def test_hashed_file_is_immutable(self):
+        response = self.get(self.name)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.get(self.name, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_range(self):
+        response = self.get(self.name, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(b''.join(self.get(self.name, HTTP_RANGE='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self.get(self.name, HTTP_RANGE='bytes=10-').status_code, 416)
+
+    def test_sendfile_handoff(self):
+        with override_settings(MEDIA_SENDFILE='nginx'):
+            response = self.get(self.name)
+        self.assertEqual(response['X-Accel-Redirect'], settings.MEDIA_ACCEL_PREFIX + self.name)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get('../settings.py').status_code, 400)
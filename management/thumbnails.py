@@ -0,0 +1,89 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from crm.asynchronous import call_in_pool
+from crm.permissions import forget_user
+from .models import User
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='crm-thumbnails')
+        return _executor
+
+
+def generate(user_pk):
+    """Create thumbnails of all PHOTO_THUMBNAILS sizes and store their URLs on the user"""
+    user = User.objects.filter(pk=user_pk).only('photo').first()
+    if user is None or not user.photo:
+        return {}
+    urls = {name: get_thumbnail(user.photo, geometry).url for name, geometry in settings.PHOTO_THUMBNAILS.items()}
+    # A newer upload replaces the photo and schedules its own thumbnails
+    User.objects.filter(pk=user_pk, photo=user.photo.name).update(photo_thumbnails=urls)
+    forget_user(user_pk)
+    return urls
+
+
+def schedule(user):
+    """Generate thumbnails in the worker pool after the transaction saving the photo commits"""
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: generate(user.pk))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(call_in_pool, generate, user.pk))
+
+
+def warm(force=False):
+    """Generate missing thumbnails of all photos, return number of processed users"""
+    users = User.objects.exclude(photo='').exclude(photo__isnull=True).only('pk', 'photo_thumbnails')
+    count = 0
+    for user in users.iterator():
+        if force or set(user.photo_thumbnails or ()) != set(settings.PHOTO_THUMBNAILS):
+            generate(user.pk)
+            count += 1
+    return count
+
+
+def delete_unreferenced(root, referenced, dry_run=False):
+    """Delete files under root whose names relative to MEDIA_ROOT are not referenced, and empty directories"""
+    deleted = []
+    for directory, _, files in os.walk(root, topdown=False):
+        for file in files:
+            path = os.path.join(directory, file)
+            name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            if name not in referenced:
+                deleted.append(name)
+                if not dry_run:
+                    os.remove(path)
+        if not dry_run and directory != root and not os.listdir(directory):
+            os.rmdir(directory)
+    return deleted
+
+
+def collect_garbage(dry_run=False):
+    """Delete photos and thumbnail files no user refers to and forget thumbnails in the sorl key value store
+
+    Return names of deleted files.
+    """
+    photos = set()
+    referenced = set()
+    for photo, urls in User.objects.values_list('photo', 'photo_thumbnails').iterator():
+        if photo:
+            photos.add(photo)
+        referenced.update(url[len(settings.MEDIA_URL):] for url in (urls or {}).values()
+                          if url.startswith(settings.MEDIA_URL))
+    field = User._meta.get_field('photo')
+    deleted = delete_unreferenced(field.storage.path(field.upload_to), photos, dry_run)
+    thumbnails = delete_unreferenced(default_storage.path(thumbnail_settings.THUMBNAIL_PREFIX), referenced, dry_run)
+    if thumbnails and not dry_run:
+        default.kvstore.cleanup()
+    return deleted + thumbnails
@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    InteractionList, InteractionListByManager, InteractionDetail = (
+        views.AsyncInteractionList, views.AsyncInteractionListByManager, views.AsyncInteractionDetail)
+else:
+    InteractionList, InteractionListByManager, InteractionDetail = (
+        views.InteractionList, views.InteractionListByManager, views.InteractionDetail)
 
-urlpatterns = [path('manager/list_by_manager', views.InteractionListByManager.as_view(), name='interaction_by_manager_list'),
-               path('interaction_list/', views.InteractionList.as_view(), name='interaction_list'),
-               path('interaction/<int:pk>/', views.InteractionDetail.as_view(), name='interaction_detail'),
+urlpatterns = [path('manager/list_by_manager', InteractionListByManager.as_view(), name='interaction_by_manager_list'),
+               path('interaction_list/', InteractionList.as_view(), name='interaction_list'),
+               path('interaction_list/export', views.InteractionExport.as_view(), name='interaction_export'),
+               path('interaction/<int:pk>/', InteractionDetail.as_view(), name='interaction_detail'),
                path('interaction/create', views.InteractionCreate.as_view(), name='interaction_create'),
                path('interaction/<int:pk>/update', views.InteractionUpdate.as_view(), name='interaction_update'),
                path('interaction/<int:pk>/delete', views.InteractionDelete.as_view(), name='interaction_delete'),
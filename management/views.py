@@ -1,21 +1,82 @@
-from django.contrib.auth.hashers import make_password
-from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.core.exceptions import ValidationError
+from django.contrib.auth import update_session_auth_hash
 from django.db.models import Q
 from django.urls import reverse_lazy, reverse
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
-from . import models, forms
+from . import facets, models, forms, thumbnails
+from .search import search_interactions
+from company.export import StreamingExportView
+from crm.asynchronous import AsyncViewMixin, evaluate_page, run_in_pool
+from crm.permissions import PermissionRequiredMixin
+from company.pagination import CursorPaginationMixin
 
 
 class KeywordsChannel:
-    """Get all keywords and all channels for the filter of interactions"""
-    def get_keywords(self):
-        keywords = models.Keyword.objects.values('keyword')
-        return keywords
-
-    def get_channel(self):
-        """Get all channels in interactions' objects"""
-        return models.Interaction.objects.values('channel').distinct()
+    """Filter interactions by q terms and by facets, count interactions per facet value"""
+    # Columns the interaction list templates render, grade and id are also needed by cursor pagination
+    list_fields = ('id', 'grade', 'channel', 'company__name', 'project__project')
+    filter_facets = facets.FACETS
+
+    def get_list_queryset(self, qs):
+        """Join company and project and load only the columns of list rows"""
+        return qs.select_related('company', 'project').only(*self.list_fields)
+
+    def get_selection(self):
+        """Get checked facet values of the request"""
+        if not hasattr(self, 'selection'):
+            self.selection = facets.get_selection(self.request.GET, self.filter_facets)
+        return self.selection
+
+    def filter_by_facets(self, qs):
+        """Filter interactions by checked facet values, the unfiltered queryset is kept for counts"""
+        self.facet_queryset = qs
+        return facets.filter_interactions(qs, self.filter_facets, self.get_selection())
+
+    def get_facets(self):
+        """Get facets with counts of interactions for the filter form"""
+        if not hasattr(self, 'facet_counts'):
+            self.facet_counts, self.facet_total = facets.count_facets(self.facet_queryset, self.filter_facets,
+                                                                      self.get_selection())
+        return self.facet_counts
+
+    def get_facet_total(self):
+        """Get number of interactions passing the filter, None if facet counts come from the cache"""
+        self.get_facets()
+        return self.facet_total
+
+    def filter_by_keywords(self, qs):
+        """Filter interactions by checked keywords and channels, free text goes to full-text search"""
+        terms = self.request.GET.getlist("q")
+        if not terms:
+            return qs
+        keywords = set(models.Keyword.objects.filter(keyword__in=terms).values_list('keyword', flat=True))
+        channels = {channel for channel, _ in models.Interaction.CHANNEL}.intersection(terms)
+        if keywords | channels != set(terms):
+            return search_interactions(qs, terms)
+        matched = models.KeywordMatch.objects.filter(keyword__keyword__in=keywords).values('interaction_id')
+        return qs.filter(Q(channel__in=channels) | Q(pk__in=matched))
+
+
+class FacetPaginationMixin:
+    """Take the number of rows for the paginator from facet counts queried by this request
+
+    Cached counts may be stale, then the paginator runs its own COUNT query.
+    """
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        total = self.get_facet_total()
+        if total is not None:
+            paginator.count = total
+        return paginator
+
+    def get_context_data(self, **kwargs):
+        """Filter parameters for links to other pages"""
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.copy()
+        for param in ('page', self.cursor_param):
+            query.pop(param, None)
+        context['filter_query'] = query.urlencode()
+        return context
 
 
 class KeywordCreate(PermissionRequiredMixin, CreateView):
@@ -25,7 +86,7 @@ class KeywordCreate(PermissionRequiredMixin, CreateView):
     permission_required = 'management.view_interaction'
 
 
-class InteractionList(PermissionRequiredMixin, ListView, KeywordsChannel):
+class InteractionList(PermissionRequiredMixin, CursorPaginationMixin, FacetPaginationMixin, ListView, KeywordsChannel):
     """Generic class-based view for a list of interactions if user can view interactions"""
     model = models.Interaction
     permission_required = 'management.view_interaction'
@@ -34,18 +95,38 @@ class InteractionList(PermissionRequiredMixin, ListView, KeywordsChannel):
     paginate_by = 10
 
     def get_queryset(self):
-        """Return interactions in according with keywords"""
-        qs = super(InteractionList, self).get_queryset()
-        q_lst = self.request.GET.getlist("q")
-        if q_lst:
-            q = '|'.join(q_lst)
-            return qs.filter(Q(channel__iregex=q) | Q(description__iregex=q)).distinct()
-        return qs
+        """Return interactions in according with keywords and facets"""
+        qs = self.get_list_queryset(super(InteractionList, self).get_queryset())
+        return self.filter_by_facets(self.filter_by_keywords(qs))
+
+
+class InteractionExport(PermissionRequiredMixin, StreamingExportView, KeywordsChannel):
+    """Stream interactions filtered like the interaction list as CSV or JSON Lines"""
+    model = models.Interaction
+    permission_required = 'management.view_interaction'
+    ordering = '-grade'
+    export_name = 'interactions'
+    export_fields = {
+        'id': 'pk',
+        'date_create': 'date_create',
+        'company': 'company.name',
+        'project': 'project.project',
+        'channel': 'channel',
+        'manager': 'manager.username',
+        'grade': 'grade',
+        'description': 'description',
+    }
+
+    def get_queryset(self):
+        """Return interactions in according with keywords and facets"""
+        qs = super().get_queryset().select_related('company', 'project', 'manager')
+        return self.filter_by_facets(self.filter_by_keywords(qs))
 
 
 class InteractionDetail(PermissionRequiredMixin, DetailView):
     """Generic class-based view for an interaction if user can view interactions"""
     model = models.Interaction
+    queryset = models.Interaction.objects.select_related('company', 'project', 'manager')
     template_name = 'management/interaction_detail.html'
     permission_required = 'management.view_interaction'
 
@@ -62,13 +143,7 @@ class InteractionUpdate(PermissionRequiredMixin, UpdateView):
     model = models.Interaction
     fields = '__all__'
     permission_required = 'management.change_interaction'
-
-    def has_permission(self):
-        """Check if current user has permission"""
-        perms = self.get_permission_required()
-        if self.request.user.username != self.get_object().manager.username:
-            raise ValidationError()
-        return self.request.user.has_perms(perms)
+    object_owner_field = 'manager'
 
 
 class InteractionDelete(PermissionRequiredMixin, DeleteView):
@@ -77,13 +152,11 @@ class InteractionDelete(PermissionRequiredMixin, DeleteView):
     template_name = 'management/interaction_delete.html'
     success_url = reverse_lazy('interaction_list')
     permission_required = 'management.delete_interaction'
+    object_owner_field = 'manager'
 
-    def has_permission(self):
-        """Check if current user has permission"""
-        perms = self.get_permission_required()
-        if self.request.user.username != self.get_object().manager.username:
-            raise ValidationError()
-        return self.request.user.has_perms(perms)
+    def get_queryset(self):
+        """Company and project are shown in the confirmation"""
+        return super().get_queryset().select_related('company', 'project')
 
 
 class ManagerDetail(PermissionRequiredMixin, DetailView):
@@ -106,34 +179,63 @@ class ManagerUpdate(PermissionRequiredMixin, UpdateView):
         return self.request.user
 
     def form_valid(self, form):
-        if form.is_valid:
-            obj = form.save(commit=False)
-            if obj.password.startswith('pbkdf2_sha256'):
-                obj.save()
-            else:
-                obj.password = make_password(obj.password)
-                obj.save()
-            return super().form_valid(form)
+        """Hash the password only when a new one is entered, the field holds the stored hash otherwise"""
+        photo_changed = 'photo' in form.changed_data
+        if photo_changed:
+            form.instance.photo_thumbnails = {}
+        password_changed = 'password' in form.changed_data
+        if password_changed:
+            form.instance.set_password(form.cleaned_data['password'])
+        response = super().form_valid(form)
+        if password_changed:
+            update_session_auth_hash(self.request, self.object)
+        if photo_changed:
+            thumbnails.schedule(self.object)
+        return response
 
     def get_success_url(self):
         """Get success url after updating"""
         return reverse('manager_detail')
 
 
-class InteractionListByManager(PermissionRequiredMixin, ListView, KeywordsChannel):
+class InteractionListByManager(PermissionRequiredMixin, CursorPaginationMixin, FacetPaginationMixin, ListView,
+                               KeywordsChannel):
     """Representing an interaction list of current user"""
     model = models.Interaction
     template_name = 'management/interaction_by_manager_list.html'
     permission_required = 'management.view_interaction'
+    ordering = '-grade'
     paginate_by = 10
+    filter_facets = tuple(facet for facet in facets.FACETS if facet.name != 'manager')
 
     def get_queryset(self):
-        """Return current user's interactions in accordance with keywords"""
+        """Return current user's interactions in accordance with keywords and facets"""
         manager = self.request.user
-        qs = super(InteractionListByManager, self).get_queryset().filter(manager=manager)
-        q_lst = self.request.GET.getlist("q")
-        if q_lst:
-            q = '|'.join(q_lst)
-            return qs.filter(Q(channel__iexact=q) | Q(description__iregex=q)).distinct()
-        return qs
+        qs = self.get_list_queryset(super(InteractionListByManager, self).get_queryset().filter(manager=manager))
+        return self.filter_by_facets(self.filter_by_keywords(qs))
+
+
+class AsyncInteractionListMixin(AsyncViewMixin):
+    """Load facet counts and then the page in the database pool, the paginator takes its count from the facets"""
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = await run_in_pool(self.get_queryset)
+        await run_in_pool(self.get_facets)
+        context = await run_in_pool(lambda: evaluate_page(self.get_context_data()))
+        return self.render_to_response(context)
+
+
+class AsyncInteractionList(AsyncInteractionListMixin, InteractionList):
+    """Interaction list for the ASGI server"""
+
+
+class AsyncInteractionListByManager(AsyncInteractionListMixin, InteractionListByManager):
+    """Current user's interaction list for the ASGI server"""
+
+
+class AsyncInteractionDetail(AsyncViewMixin, InteractionDetail):
+    """Interaction detail for the ASGI server"""
 
+    async def get(self, request, *args, **kwargs):
+        self.object = await run_in_pool(self.get_object)
+        return self.render_to_response(self.get_context_data(object=self.object))